@@ -1,7 +1,124 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import Plot from "react-plotly.js";
+import { feature } from "topojson-client";
 import { formatCurrency } from "../../../lang/format"; // Adjust path as needed
 
+// Binary district bundle written by district_bundle.py: every column of the
+// district table as a typed array, plus the hex geometry, all in
+// district_index order, so nothing is parsed or joined here
+const BUNDLE_URL = '/data/snap_district_bundle.bin';
+const BUNDLE_VERSION = 2;
+const BUNDLE_TYPES = {
+  float32: Float32Array, float64: Float64Array, int32: Int32Array,
+  uint8: Uint8Array, uint16: Uint16Array, uint32: Uint32Array,
+};
+
+async function fetchBundle() {
+  const buffer = await (await fetch(BUNDLE_URL)).arrayBuffer();
+  const header = new DataView(buffer, 0, 12);
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== 'SNDB' || header.getUint32(4, true) !== BUNDLE_VERSION) {
+    throw new Error(`${BUNDLE_URL} is not a version ${BUNDLE_VERSION} district bundle`);
+  }
+  const manifestLength = header.getUint32(8, true);
+  const manifest = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, manifestLength)));
+  const start = 12 + manifestLength;
+  const arrays = {};
+  Object.entries(manifest.arrays).forEach(([name, entry]) => {
+    arrays[name] = new BUNDLE_TYPES[entry.dtype](buffer, start + entry.offset, entry.length);
+  });
+  return { ...manifest, arrays };
+}
+
+// Hex GeoJSON built from the bundle's coordinate and offset arrays, with each
+// feature's id set to its district_index
+function hexFeatures(bundle) {
+  const {
+    hex_coordinates: xy, hex_ring_offsets: rings,
+    hex_polygon_offsets: polygons, hex_district_offsets: districts,
+  } = bundle.arrays;
+  const features = [];
+  for (let i = 0; i < bundle.n_districts; i++) {
+    const coordinates = [];
+    for (let p = districts[i]; p < districts[i + 1]; p++) {
+      const polygon = [];
+      for (let r = polygons[p]; r < polygons[p + 1]; r++) {
+        const ring = [];
+        for (let k = rings[r]; k < rings[r + 1]; k++) ring.push([xy[2 * k], xy[2 * k + 1]]);
+        polygon.push(ring);
+      }
+      coordinates.push(polygon);
+    }
+    features.push({ type: 'Feature', id: i, properties: {}, geometry: { type: 'MultiPolygon', coordinates } });
+  }
+  return { type: 'FeatureCollection', features };
+}
+
+// Geographic map from convert_census_to_geojson.py: a coarse TopoJSON
+// overview loads first, and as the map is zoomed in the districts in view
+// are replaced with finer ones from the tile pyramid
+const REAL_TILES_URL = '/data/real_district_tiles';
+// Degrees from the view center to its edge at projection scale 1
+const REAL_VIEW_HALF_SPAN = { lon: 32, lat: 14 };
+const REAL_DEFAULT_CENTER = { lon: -96, lat: 38.5 };
+const realTileCache = {};
+let realTileIndex = null;
+
+async function fetchRealOverview() {
+  const response = await fetch('/data/real_congressional_districts_low.topojson');
+  const topology = await response.json();
+  return feature(topology, topology.objects.districts);
+}
+
+async function fetchRealTileIndex() {
+  if (!realTileIndex) {
+    const response = await fetch(`${REAL_TILES_URL}/index.json`);
+    realTileIndex = await response.json();
+  }
+  return realTileIndex;
+}
+
+function fetchRealTile(path) {
+  if (!realTileCache[path]) {
+    realTileCache[path] = fetch(`${REAL_TILES_URL}/${path}.geojson`).then(r => r.json());
+  }
+  return realTileCache[path];
+}
+
+// Tiles holding the districts that overlap the view, at the finest tile zoom
+// whose min_scale the view has reached (none at the overview scale)
+function realTilesInView(index, { scale, center }) {
+  const zoom = Object.keys(index.zooms)
+    .filter(z => scale >= index.zooms[z].min_scale)
+    .sort((a, b) => a - b).pop();
+  if (zoom === undefined) return [];
+  // Half again as wide as the view, so a short pan needs no new tiles
+  const halfLon = 1.5 * REAL_VIEW_HALF_SPAN.lon / scale;
+  const halfLat = 1.5 * REAL_VIEW_HALF_SPAN.lat / scale;
+  const paths = new Set();
+  index.districts.forEach(d => {
+    const [minLon, minLat, maxLon, maxLat] = d.bbox;
+    if (maxLon < center.lon - halfLon || minLon > center.lon + halfLon) return;
+    if (maxLat < center.lat - halfLat || minLat > center.lat + halfLat) return;
+    const [x, y] = d.tiles[zoom];
+    paths.add(`${zoom}/${x}/${y}`);
+  });
+  return [...paths].sort();
+}
+
+// The overview with every district found in the given tiles replaced by its
+// detailed geometry. Districts are stored whole in one tile, so the result
+// has no seams at tile edges.
+async function fetchRealGeoJSON(overview, paths) {
+  const tiles = await Promise.all(paths.map(fetchRealTile));
+  const detailed = {};
+  tiles.forEach(tile => tile.features.forEach(f => { detailed[f.properties.GEOID] = f; }));
+  return {
+    type: 'FeatureCollection',
+    features: overview.features.map(f => detailed[f.properties.GEOID] || f)
+  };
+}
+
 /**
  * Interactive map showing SNAP benefits by congressional district
  *
@@ -12,48 +129,21 @@ export default function SNAPDistrictMap(props) {
   const { metadata, mobile } = props;
   const [hexGeoJSON, setHexGeoJSON] = useState(null);
   const [realGeoJSON, setRealGeoJSON] = useState(null);
-  const [snapData, setSnapData] = useState(null);
+  const [bundle, setBundle] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [mapType, setMapType] = useState('hex'); // 'hex' or 'real'
+  const [realOverview, setRealOverview] = useState(null);
+  const realView = useRef({ scale: 1, center: REAL_DEFAULT_CENTER });
+  const realTileKey = useRef('');
 
   useEffect(() => {
     async function loadData() {
       try {
-        // Load both GeoJSON files
-        const hexResponse = await fetch('/data/hex_congressional_districts.geojson');
-        const hexData = await hexResponse.json();
-
-        const realResponse = await fetch('/data/real_congressional_districts.geojson');
-        const realData = await realResponse.json();
-
-        // Load SNAP data
-        const snapResponse = await fetch('/data/snap_by_congressional_district.csv');
-        const snapText = await snapResponse.text();
-
-        // Parse CSV
-        const lines = snapText.trim().split('\n');
-        const snapDataMap = {};
-
-        for (let i = 1; i < lines.length; i++) {
-          const values = lines[i].split(',');
-          const geoid = values[0];
-          const stateFips = values[1].padStart(2, '0');
-          const cd = geoid.slice(stateFips.length).padStart(2, '0');
-          const fullGeoid = stateFips + cd;
-
-          snapDataMap[fullGeoid] = {
-            geoid: geoid,
-            stateFips: stateFips,
-            districtNumber: cd,
-            totalSnap: parseFloat(values[2]),
-            population: parseFloat(values[3])
-          };
-        }
-
-        setHexGeoJSON(hexData);
-        setRealGeoJSON(realData);
-        setSnapData(snapDataMap);
+        // The bundle is all the hex view needs
+        const bundleData = await fetchBundle();
+        setBundle(bundleData);
+        setHexGeoJSON(hexFeatures(bundleData));
         setLoading(false);
       } catch (err) {
         console.error('Error loading map data:', err);
@@ -65,6 +155,41 @@ export default function SNAPDistrictMap(props) {
     loadData();
   }, []);
 
+  // The geographic overview is fetched the first time the user switches to it
+  useEffect(() => {
+    if (mapType !== 'real' || realOverview) return;
+    fetchRealOverview()
+      .then(realData => {
+        setRealOverview(realData);
+        setRealGeoJSON(realData);
+      })
+      .catch(err => setError(err.message));
+  }, [mapType, realOverview]);
+
+  // Stream in finer geography for the districts in view as the user zooms
+  // and pans the real map
+  function handleRelayout(event) {
+    if (mapType !== 'real') return;
+    const view = realView.current;
+    const scale = event['geo.projection.scale'];
+    const lon = event['geo.center.lon'];
+    const lat = event['geo.center.lat'];
+    if (scale === undefined && lon === undefined && lat === undefined) return;
+    realView.current = {
+      scale: scale !== undefined ? scale : view.scale,
+      center: { lon: lon !== undefined ? lon : view.center.lon, lat: lat !== undefined ? lat : view.center.lat }
+    };
+    fetchRealTileIndex().then(index => {
+      const paths = realTilesInView(index, realView.current);
+      const key = paths.join(',');
+      if (key === realTileKey.current) return;
+      realTileKey.current = key;
+      return fetchRealGeoJSON(realOverview, paths).then(geoJSON => {
+        if (realTileKey.current === key) setRealGeoJSON(geoJSON);
+      });
+    });
+  }
+
   if (loading) {
     return <div style={{ textAlign: 'center', padding: '40px' }}>Loading map data...</div>;
   }
@@ -78,12 +203,16 @@ export default function SNAPDistrictMap(props) {
   // Get current GeoJSON based on map type
   const geoJSON = mapType === 'hex' ? hexGeoJSON : realGeoJSON;
 
-  // Calculate statistics
-  const totalBenefits = Object.values(snapData).reduce((sum, d) => sum + d.totalSnap, 0);
-  const totalPopulation = Object.values(snapData).reduce((sum, d) => sum + d.population, 0);
-  const districtCount = Object.keys(snapData).length;
-  const avgBenefits = totalBenefits / districtCount;
-  const avgPopulation = totalPopulation / districtCount;
+  // Statistics and color range, precomputed by district_bundle.py
+  const arrays = bundle.arrays;
+  const benefitsSummary = bundle.metrics.total_weighted_snap.national;
+  const populationSummary = bundle.metrics.snap_population.national;
+  const totalBenefits = benefitsSummary.total;
+  const totalPopulation = populationSummary.total;
+  const districtCount = bundle.n_districts;
+  const avgBenefits = benefitsSummary.mean;
+  const avgPopulation = populationSummary.mean;
+  const benefitBreaks = bundle.metrics.total_weighted_snap.jenks_breaks.map(b => b / 1e6);
 
   // Prepare data for Plotly choropleth
   const locations = [];
@@ -91,17 +220,16 @@ export default function SNAPDistrictMap(props) {
   const text = [];
   const customdata = [];
 
-  geoJSON.features.forEach(feature => {
-    // Handle both hex and real GeoJSON property names
-    const state = (feature.properties.STATE || feature.properties.STATEFP).padStart(2, '0');
-    const cd = (feature.properties.CD || feature.properties.CD118FP).padStart(2, '0');
-    const locId = state + cd;
-
-    const snapInfo = snapData[locId];
-    const benefits = snapInfo ? snapInfo.totalSnap : 0;
-    const population = snapInfo ? snapInfo.population : 0;
+  (geoJSON ? geoJSON.features : []).forEach(feature => {
+    // Hex features carry their district_index as id, real ones as a property;
+    // either way it indexes the bundle's arrays directly
+    const i = mapType === 'hex' ? feature.id : feature.properties.district_index;
+    const state = String(arrays.state_fips[i]).padStart(2, '0');
+    const cd = String(arrays.congressional_district_geoid[i] % 100).padStart(2, '0');
+    const benefits = arrays.total_weighted_snap[i];
+    const population = arrays.snap_population[i];
 
-    locations.push(locId);
+    locations.push(i);
     z.push(benefits / 1e6); // Convert to millions for colorscale
 
     // Store district info for hover
@@ -115,28 +243,29 @@ export default function SNAPDistrictMap(props) {
     // Build hover text
     const districtName = feature.properties.NAMELSAD
       ? feature.properties.NAMELSAD
-      : feature.properties.NAME
-      ? `District ${feature.properties.NAME}`
-      : `District ${cd}`;
+      : `${bundle.labels.state_abbrev[i]} District ${bundle.labels.district_label[i]}`;
 
     text.push(
       `${districtName}<br>` +
-      `State FIPS: ${state}<br>` +
-      `SNAP Benefits: $${(benefits / 1e6).toFixed(1)}M<br>` +
+      `${bundle.labels.state_name[i]}<br>` +
+      `SNAP Benefits: $${(benefits / 1e6).toFixed(1)}M ` +
+      `(rank ${arrays.total_weighted_snap_rank[i]} of ${districtCount})<br>` +
       `Recipients: ${(population / 1e3).toFixed(1)}K`
     );
   });
 
   // Add location IDs to GeoJSON features for matching
-  geoJSON.features.forEach((feature, idx) => {
+  (geoJSON ? geoJSON.features : []).forEach((feature, idx) => {
     feature.id = locations[idx];
   });
 
   const data = [{
     type: 'choropleth',
-    geojson: geoJSON,
+    geojson: geoJSON || { type: 'FeatureCollection', features: [] },
     locations: locations,
     z: z,
+    zmin: benefitsSummary.min / 1e6,
+    zmax: benefitsSummary.max / 1e6,
     text: text,
     featureidkey: 'id',
     locationmode: 'geojson-id',
@@ -153,6 +282,8 @@ export default function SNAPDistrictMap(props) {
         text: 'SNAP Benefits<br>($M)',
         side: 'right'
       },
+      tickvals: benefitBreaks,
+      ticktext: benefitBreaks.map(b => b.toFixed(0)),
       thickness: 20,
       len: 0.7,
       outlinewidth: 0
@@ -187,7 +318,9 @@ export default function SNAPDistrictMap(props) {
       ? { t: 40, b: 0, l: 0, r: 0 }
       : { t: 60, b: 0, l: 0, r: 0 },
     paper_bgcolor: 'rgba(0,0,0,0)',
-    plot_bgcolor: 'rgba(0,0,0,0)'
+    plot_bgcolor: 'rgba(0,0,0,0)',
+    // Keep the user's zoom when finer geography streams in
+    uirevision: mapType
   };
 
   const config = {
@@ -276,6 +409,7 @@ export default function SNAPDistrictMap(props) {
         data={data}
         layout={layout}
         config={config}
+        onRelayout={handleRelayout}
         style={{ width: '100%' }}
       />
     </div>
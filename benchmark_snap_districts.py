@@ -0,0 +1,176 @@
+"""Benchmark the snap_districts.py pipeline stages on synthetic states.
+
+Runs offline: a stand-in for Microsimulation serves randomly generated
+household and person tables, so no hf:// dataset or model is needed. Each
+state runs through the pipeline's own process_state and calibrate, and
+stage times come from the StageMetrics events they record, so the
+benchmark measures the code snap_districts.py runs.
+
+Example:
+    python benchmark_snap_districts.py --persons 10000 1000000 --districts 1 52
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import types
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import snap_districts
+
+
+PERSONS_PER_HOUSEHOLD = 2.5
+STAGES = ['extraction', 'person_rollup', 'district_totals', 'weighted_median',
+          'calibration', 'csv_write']
+
+
+class SyntheticMicrosimulation:
+    """Stand-in for Microsimulation serving synthetic state data.
+
+    Implements the parts extract_entities uses: calculate_dataframe,
+    returning the generated columns for the requested variables, and
+    map_result from households to persons.
+
+    Args:
+        n_persons: Number of person records
+        n_districts: Number of congressional districts in the state
+        state_fips: State FIPS code for the generated geoids
+        seed: Random seed
+    """
+
+    def __init__(self, n_persons, n_districts, state_fips=6, seed=0):
+        rng = np.random.default_rng(seed)
+        n_households = max(1, int(n_persons / PERSONS_PER_HOUSEHOLD))
+
+        household_id = np.arange(n_households)
+        person_household_id = np.sort(rng.integers(0, n_households, n_persons))
+        self.arrays = {
+            'household_id': household_id,
+            'household_weight': rng.uniform(10, 1000, n_households),
+            'congressional_district_geoid': state_fips * 100 + rng.integers(1, n_districts + 1, n_households),
+            'state_fips': np.full(n_households, state_fips),
+            'household_market_income': rng.lognormal(10, 1.2, n_households),
+            'snap': np.where(rng.random(n_households) < 0.15,
+                             rng.uniform(200, 12000, n_households), 0.0),
+            'person_id': np.arange(n_persons),
+            'person_household_id': person_household_id,
+            'age': rng.integers(0, 90, n_persons).astype(float),
+            'employment_income': np.where(rng.random(n_persons) < 0.5,
+                                          rng.lognormal(10, 1, n_persons), 0.0),
+        }
+
+    def calculate_dataframe(self, variable_names, period=None, map_to=None, use_weights=True):
+        return pd.DataFrame({name: self.arrays[name] for name in variable_names})
+
+    def map_result(self, values, source_entity, target_entity, how=None):
+        # Household ids are their row positions
+        return np.asarray(values)[self.arrays['person_household_id']]
+
+
+@contextmanager
+def synthetic_model(sim):
+    """Serve sim as policyengine_us.Microsimulation while the block runs."""
+    module = types.ModuleType('policyengine_us')
+    module.Microsimulation = lambda dataset=None, **kwargs: sim
+    saved = sys.modules.get('policyengine_us')
+    sys.modules['policyengine_us'] = module
+    try:
+        yield
+    finally:
+        if saved is None:
+            del sys.modules['policyengine_us']
+        else:
+            sys.modules['policyengine_us'] = saved
+
+
+def run_case(n_persons, n_districts, seed=0, replicates=0):
+    """Time each pipeline stage once for a synthetic state.
+
+    The state goes through snap_districts.process_state and calibrate,
+    with the model replaced by a SyntheticMicrosimulation built beforehand,
+    and stage times are read back from the StageMetrics events they record.
+    With replicates, the bootstrap standard errors are timed as an extra
+    standard_errors stage.
+
+    Returns:
+        Tuple of (dict of stage -> seconds, number of households)
+    """
+    sim = SyntheticMicrosimulation(n_persons, n_districts, seed=seed)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        metrics = snap_districts.StageMetrics(os.path.join(tmp_dir, 'metrics.jsonl'))
+        with synthetic_model(sim):
+            district_df = snap_districts.process_state('CA', metrics=metrics, replicates=replicates)
+        with metrics.stage('', 'calibration') as event:
+            combined_df = snap_districts.calibrate(district_df)
+            event['rows'] = len(combined_df)
+        with metrics.stage('', 'csv_write') as event:
+            combined_df.to_csv(os.path.join(tmp_dir, 'districts.csv'), index=False)
+            event['rows'] = len(combined_df)
+        events = metrics.events()
+
+    timings = events.groupby('stage')['wall_s'].sum().to_dict()
+    households = int(events.loc[events['stage'] == 'extraction', 'rows'].iloc[0])
+    return timings, households
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SNAP district pipeline offline")
+    parser.add_argument('--persons', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help="Person counts to benchmark (default: 10000 100000 1000000)")
+    parser.add_argument('--districts', type=int, nargs='+', default=[1, 52],
+                        help="Districts per state to benchmark (default: 1 52)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Runs per case; the fastest time per stage is kept (default: 3)")
+    parser.add_argument('--replicates', type=int, default=0,
+                        help="Also time bootstrap standard errors with this many replicates")
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help="JSON file to append this run to (default: benchmark_results.json)")
+    args = parser.parse_args()
+
+    cases = []
+    for n_persons in args.persons:
+        for n_districts in args.districts:
+            runs = [run_case(n_persons, n_districts, seed=i, replicates=args.replicates)
+                    for i in range(args.repeat)]
+            stages = {stage: min(timings[stage] for timings, _ in runs) for stage in STAGES
+                      + (['standard_errors'] if args.replicates else [])}
+            cases.append({
+                'persons': n_persons,
+                'households': runs[0][1],
+                'districts': n_districts,
+                'stages': stages,
+                'total': sum(stages.values()),
+            })
+            print(f"{n_persons:>10,} persons, {n_districts:>2} districts: "
+                  + ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in stages.items()))
+
+    run = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'repeat': args.repeat,
+        'replicates': args.replicates,
+        'cases': cases,
+    }
+
+    history = {'runs': []}
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            history = json.load(f)
+    history['runs'].append(run)
+    with open(args.output, 'w') as f:
+        json.dump(history, f, indent=2)
+    print(f"Results appended to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Content-hashed, precompressed build of the map pages and their data.
+
+Copies the HTML pages and every data file they load into an output
+directory (dist/ by default), with:
+
+- GeoJSON minified and its coordinates rounded to COORDINATE_DECIMALS
+  (about a metre), and CSV floats rounded to CSV_DECIMALS
+- each data file renamed to name.<hash>.ext, where <hash> is the start of
+  the sha256 of its built contents; the tile pyramid directory is hashed as
+  a whole, since pages build tile URLs from its name
+- the pages' references rewritten to the hashed names
+- .gz and, if the brotli package is installed, .br siblings of every text
+  or binary file they make smaller
+
+Hashed files never change under the same name, so they can be served with
+"Cache-Control: public, max-age=31536000, immutable"; only the HTML pages
+need revalidating. Servers with gzip_static/brotli_static (or a CDN
+configured to) send the precompressed siblings as-is. asset-manifest.json
+maps each source file to its hashed name.
+
+Example:
+    python build_assets.py --out-dir dist
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COORDINATE_DECIMALS = 5
+CSV_DECIMALS = 2
+HASH_LENGTH = 10
+
+PAGES = ['index.html', 'snap_map_with_toggle.html', 'snap_hexmap_interactive.html']
+ASSETS = [
+    'hex_congressional_districts.geojson',
+    'snap_by_congressional_district.csv',
+    'snap_district_bundle.bin',
+    'real_congressional_districts_low.topojson',
+    'policyengine-logo.svg',
+]
+ASSET_DIRS = ['real_district_tiles']
+
+# Extensions worth precompressing (the bundle is binary but mostly floats
+# and offsets, which still compress well)
+COMPRESSIBLE = {'.html', '.geojson', '.topojson', '.json', '.csv', '.svg', '.bin'}
+
+
+def round_coordinates(coordinates, decimals):
+    """Round nested GeoJSON coordinate lists."""
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(value, decimals) for value in coordinates]
+    return [round_coordinates(part, decimals) for part in coordinates]
+
+
+def minify_geojson(data, decimals=COORDINATE_DECIMALS):
+    """Compact GeoJSON with coordinates rounded to a fixed grid."""
+    geojson = json.loads(data)
+    features = geojson['features'] if geojson.get('type') == 'FeatureCollection' else [geojson]
+    for feature in features:
+        geometry = feature.get('geometry')
+        if geometry and 'coordinates' in geometry:
+            geometry['coordinates'] = round_coordinates(geometry['coordinates'], decimals)
+    return json.dumps(geojson, separators=(',', ':')).encode()
+
+
+def minify_json(data):
+    return json.dumps(json.loads(data), separators=(',', ':')).encode()
+
+
+def minify_csv(path, decimals=CSV_DECIMALS):
+    """CSV with floats rounded; column order and headers are unchanged."""
+    return pd.read_csv(path).round(decimals).to_csv(index=False).encode()
+
+
+def build_file(path):
+    """Built contents of one source file."""
+    extension = os.path.splitext(path)[1]
+    if extension == '.csv':
+        return minify_csv(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    if extension == '.geojson':
+        return minify_geojson(data)
+    if extension in ('.json', '.topojson'):
+        return minify_json(data)
+    return data
+
+
+def hashed_name(name, digest):
+    """name.<hash>.ext for a file, or name.<hash> for a directory."""
+    stem, extension = os.path.splitext(name)
+    return f'{stem}.{digest[:HASH_LENGTH]}{extension}'
+
+
+def write_file(path, data):
+    """Write data and its precompressed siblings where they are smaller.
+
+    Returns:
+        Tuple of (bytes, gzip bytes or None)
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    gzip_size = None
+    if os.path.splitext(path)[1] in COMPRESSIBLE:
+        compressed = {'.gz': gzip.compress(data, 9, mtime=0)}
+        if brotli is not None:
+            compressed['.br'] = brotli.compress(data, quality=11)
+        for suffix, payload in compressed.items():
+            if len(payload) < len(data):
+                with open(path + suffix, 'wb') as f:
+                    f.write(payload)
+        gzip_size = len(compressed['.gz'])
+    return len(data), gzip_size
+
+
+def build_assets(out_dir='dist', source_dir='.'):
+    """Build hashed, compressed assets and rewritten pages into out_dir.
+
+    Missing sources (e.g. geographic files not built yet) are skipped and
+    their references left as they are.
+
+    Returns:
+        Dict mapping each source name to its hashed name
+    """
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    manifest = {}
+    sizes = {}
+
+    for name in ASSETS:
+        path = os.path.join(source_dir, name)
+        if not os.path.exists(path):
+            print(f"Skipping {name} (not found)")
+            continue
+        data = build_file(path)
+        manifest[name] = hashed_name(name, hashlib.sha256(data).hexdigest())
+        sizes[name] = (os.path.getsize(path), *write_file(os.path.join(out_dir, manifest[name]), data))
+
+    for name in ASSET_DIRS:
+        root = os.path.join(source_dir, name)
+        if not os.path.isdir(root):
+            print(f"Skipping {name}/ (not found)")
+            continue
+        files = sorted(
+            os.path.relpath(os.path.join(directory, file), root)
+            for directory, _, names in os.walk(root) for file in names
+        )
+        built = {file: build_file(os.path.join(root, file)) for file in files}
+        digest = hashlib.sha256()
+        for file, data in built.items():
+            digest.update(file.encode() + b'\0' + hashlib.sha256(data).digest())
+        manifest[name] = hashed_name(name, digest.hexdigest())
+        totals = [0, 0, 0]
+        for file, data in built.items():
+            size, gzip_size = write_file(os.path.join(out_dir, manifest[name], file), data)
+            totals[0] += os.path.getsize(os.path.join(root, file))
+            totals[1] += size
+            totals[2] += gzip_size or size
+        sizes[name + '/'] = tuple(totals)
+
+    # Longest names first, so no name is replaced inside a longer one
+    references = sorted(manifest.items(), key=lambda item: -len(item[0]))
+    for page in PAGES:
+        path = os.path.join(source_dir, page)
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        for name, hashed in references:
+            html = html.replace(f'./{name}', f'./{hashed}').replace(f'"{name}"', f'"{hashed}"')
+        write_file(os.path.join(out_dir, page), html.encode())
+
+    with open(os.path.join(out_dir, 'asset-manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    for name, (source, built, gzipped) in sizes.items():
+        print(f"{name:45s} {source / 1e3:9,.0f} KB -> {built / 1e3:9,.0f} KB, "
+              f"{(gzipped or built) / 1e3:9,.0f} KB gzipped")
+    if brotli is None:
+        print("brotli is not installed; wrote .gz siblings only (pip install brotli for .br)")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-hashed, precompressed build of the map pages")
+    parser.add_argument('--out-dir', default='dist', help="Output directory (default: dist)")
+    args = parser.parse_args()
+
+    manifest = build_assets(args.out_dir)
+    print(f"Built {len(manifest)} assets and {len(PAGES)} pages into {args.out_dir}/")
+
+
+if __name__ == '__main__':
+    main()
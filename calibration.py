@@ -0,0 +1,214 @@
+"""Raking household weights to several national and state targets at once.
+
+Targets are weighted totals of household-level quantities (SNAP benefits,
+SNAP recipients, SNAP households), nationally or within a state. The
+calibrated weights are w = d * exp(X @ lambda), where d are the survey
+weights and X is a sparse households x targets matrix, with lambda found
+by Newton's method on the K target equations. Each iteration is a handful
+of sparse matrix-vector products plus a K x K solve, so hundreds of
+targets over millions of households converge in well under a second.
+
+The targets file is JSON such as:
+
+    {
+        "national": {"snap_benefits": 106744001279, "snap_recipients": 41700000},
+        "states": {"CA": {"snap_benefits": 12300000000, "snap_households": 3100000}}
+    }
+"""
+
+import json
+
+import numpy as np
+import scipy.sparse as sp
+
+
+# Household-level quantity whose weighted total each target names
+TARGET_QUANTITIES = {
+    'snap_benefits': lambda households: households['snap'].values.astype(float),
+    'snap_recipients': lambda households: households['n_snap_recipients'].values.astype(float),
+    'snap_households': lambda households: (households['snap'].values > 0).astype(float),
+}
+
+
+def load_targets(path):
+    """Read a targets file, checking every target name is known."""
+    with open(path) as f:
+        targets = json.load(f)
+    names = set(targets.get('national', {}))
+    for state_targets in targets.get('states', {}).values():
+        names |= set(state_targets)
+    unknown = names - set(TARGET_QUANTITIES)
+    if unknown:
+        raise ValueError(f"unknown targets: {', '.join(sorted(unknown))}; "
+                         f"expected {', '.join(TARGET_QUANTITIES)}")
+    return targets
+
+
+def target_matrix(households, targets, state_fips):
+    """Sparse households x targets design matrix and target totals.
+
+    Args:
+        households: Household records with snap and n_snap_recipients
+        targets: Dict with optional "national" and "states" target dicts
+        state_fips: Dict of state abbreviation -> FIPS code
+
+    Returns:
+        Tuple of (CSR matrix, array of totals, list of target labels)
+    """
+    household_state = households['state_fips'].values.astype(int)
+
+    totals, labels = [], []
+    national_column = {}
+    for name, total in targets.get('national', {}).items():
+        national_column[name] = len(totals)
+        totals.append(total)
+        labels.append(f"national {name}")
+    # state_column[name][fips] is the target column for that state, or -1
+    state_column = {name: np.full(max(state_fips.values()) + 1, -1) for name in TARGET_QUANTITIES}
+    for state, state_targets in targets.get('states', {}).items():
+        for name, total in state_targets.items():
+            state_column[name][state_fips[state]] = len(totals)
+            totals.append(total)
+            labels.append(f"{state} {name}")
+
+    # Only nonzero entries are stored: households without SNAP contribute
+    # nothing to any target
+    row_index, column_index, values = [], [], []
+    for name, quantity in TARGET_QUANTITIES.items():
+        value = quantity(households)
+        nonzero = np.flatnonzero(value)
+        if name in national_column:
+            row_index.append(nonzero)
+            column_index.append(np.full(len(nonzero), national_column[name]))
+            values.append(value[nonzero])
+        columns = state_column[name][household_state[nonzero]]
+        in_target = columns >= 0
+        row_index.append(nonzero[in_target])
+        column_index.append(columns[in_target])
+        values.append(value[nonzero][in_target])
+
+    matrix = sp.csr_matrix(
+        (np.concatenate(values), (np.concatenate(row_index), np.concatenate(column_index))),
+        shape=(len(households), len(totals)))
+    return matrix, np.asarray(totals, dtype=float), labels
+
+
+def rake_weights(matrix, totals, weights, tol=1e-8, max_iter=50):
+    """Raking (exponential) calibration of weights to target totals.
+
+    Args:
+        matrix: Sparse households x targets matrix
+        totals: Target weighted totals, one per column
+        weights: Starting household weights
+        tol: Maximum relative error on any target at convergence
+        max_iter: Newton iterations before giving up
+
+    Returns:
+        Calibrated weights
+
+    Raises:
+        ValueError: If the targets can't be met within max_iter
+    """
+    weights = np.asarray(weights, dtype=float)
+    matrix = sp.csr_matrix(matrix)
+    # Rows with no entries keep their weight; only the rest are iterated
+    active = np.diff(matrix.indptr) > 0
+    # Scale each target to order one so the Newton system is well conditioned
+    scale = 1 / np.maximum(np.abs(totals), 1)
+    matrix = (matrix[active] @ sp.diags(scale)).tocsr()
+    totals = totals * scale
+    transposed = matrix.T.tocsr()
+    row_of_entry = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    base_weights = weights
+    weights = weights[active]
+
+    def dual(log_ratio):
+        # Convex objective whose gradient is minus the target residual
+        calibrated = weights * np.exp(matrix @ log_ratio)
+        return calibrated.sum() - totals @ log_ratio, calibrated
+
+    log_ratio = np.zeros(matrix.shape[1])
+    objective, calibrated = dual(log_ratio)
+    for _ in range(max_iter):
+        residual = totals - transposed @ calibrated
+        error = np.max(np.abs(residual) / np.maximum(np.abs(totals), 1e-12))
+        if error < tol:
+            result = base_weights.copy()
+            result[active] = calibrated
+            return result
+        # X' diag(w) X, scaling X's entries in place of a diagonal product
+        weighted = sp.csr_matrix((matrix.data * calibrated[row_of_entry], matrix.indices, matrix.indptr),
+                                 shape=matrix.shape)
+        jacobian = (transposed @ weighted).toarray()
+        step = np.linalg.lstsq(jacobian, residual, rcond=None)[0]
+        # Halve the Newton step until the objective decreases
+        for _ in range(30):
+            new_objective, new_calibrated = dual(log_ratio + step)
+            if new_objective <= objective:
+                break
+            step = step / 2
+        log_ratio = log_ratio + step
+        objective, calibrated = new_objective, new_calibrated
+    raise ValueError(f"raking did not converge in {max_iter} iterations; "
+                     f"largest relative error {error:.2e}")
+
+
+# Households per block when raking replicate weights
+REPLICATE_BLOCK_ROWS = 16_384
+
+
+def rake_replicates(matrix, totals, weights, multipliers, tol=1e-8, max_iter=50,
+                    block_rows=REPLICATE_BLOCK_ROWS):
+    """Rake every column of a bootstrap replicate weight matrix to the totals.
+
+    Replicate r starts from weights * multipliers[:, r], with weights
+    already raked to the totals, and is calibrated within the same
+    exponential family, so its raked weights are
+    weights * multipliers[:, r] * exp(matrix @ log_ratios[:, r]). All
+    replicates are solved together with the Jacobian of the raked weights
+    themselves: the multipliers have mean one, so each replicate's own
+    Jacobian is close to it and the iteration converges in a few steps of
+    sparse products over the households x R matrix. Each step works
+    through the households block_rows at a time, so beyond the multipliers
+    themselves its floating-point temporaries are a few block_rows x R
+    arrays (about 26 MB each at the default and R=200).
+
+    Args:
+        matrix: Sparse households x targets matrix, for households that
+            appear in at least one target
+        totals: Target weighted totals, one per column
+        weights: Household weights raked to the totals, e.g. by rake_weights
+        multipliers: households x R bootstrap multipliers, e.g. the uint8
+            counts from uncertainty.replicate_multipliers
+        tol: Maximum relative error on any target at convergence
+        max_iter: Iterations before giving up
+        block_rows: Households per block of each step
+
+    Returns:
+        targets x R log_ratios
+
+    Raises:
+        ValueError: If some replicate can't meet the targets within max_iter
+    """
+    weights = np.asarray(weights, dtype=float)
+    scale = 1 / np.maximum(np.abs(totals), 1)
+    matrix = (sp.csr_matrix(matrix) @ sp.diags(scale)).tocsr()
+    totals = totals * scale
+    # Pseudo-inverse, as rake_weights' lstsq, for targets that coincide
+    inverse = np.linalg.pinv((matrix.T @ sp.diags(weights) @ matrix).toarray())
+    blocks = [(matrix[start:start + block_rows], slice(start, start + block_rows))
+              for start in range(0, matrix.shape[0], block_rows)]
+
+    log_ratios = np.zeros((matrix.shape[1], multipliers.shape[1]))
+    for _ in range(max_iter):
+        # Replicate totals, one block of households at a time
+        achieved = sum(block_matrix.T @ (weights[rows, None] * multipliers[rows]
+                                         * np.exp(block_matrix @ log_ratios))
+                       for block_matrix, rows in blocks)
+        residual = totals[:, None] - achieved
+        error = np.max(np.abs(residual) / np.maximum(np.abs(totals), 1e-12)[:, None])
+        if error < tol:
+            return log_ratios * scale[:, None]
+        log_ratios = log_ratios + inverse @ residual
+    raise ValueError(f"raking replicates did not converge in {max_iter} iterations; "
+                     f"largest relative error {error:.2e}")
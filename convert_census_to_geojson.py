@@ -1,5 +1,33 @@
 import geopandas as gpd
 import json
+import math
+import os
+import shutil
+
+import numpy as np
+import shapely
+import topojson
+from shapely.geometry import mapping
+from shapely.geometry.polygon import orient
+
+from district_geometry import load_district_geometry, single_district_states
+
+# Whole-country overview loaded with the page: simplification tolerance
+# (degrees) and quantization, fine enough that grid snapping stays well
+# under the tolerance
+OVERVIEW = {'tolerance': 0.01, 'quantization': 1e5}
+overview_path = 'real_congressional_districts_low.topojson'
+
+# Tile pyramid streamed in as the user zooms: for each XYZ tile zoom, the
+# simplification tolerance (degrees), the coordinate rounding, and the
+# Plotly geo projection scale from which the pages switch to it. Each
+# tolerance is about a pixel at that scale.
+TILE_ZOOMS = {
+    6: {'tolerance': 0.002, 'decimals': 4, 'min_scale': 4},    # a region or state
+    8: {'tolerance': 0.0005, 'decimals': 4, 'min_scale': 16},  # a metro area
+    10: {'tolerance': 0.0001, 'decimals': 5, 'min_scale': 64}, # a few districts
+}
+tiles_dir = 'real_district_tiles'
 
 # Load Census Bureau shapefile
 census_gdf = gpd.read_file('cb_2023_us_cd118_5m.shp')
@@ -20,19 +48,97 @@ census_gdf['CD'] = census_gdf['CD118FP']
 
 # The GEOID in Census data is already formatted as SSCDD (state + district)
 # For example: "0601" for California's 1st district
-census_gdf['GEOID_FULL'] = census_gdf['GEOID']
 
 # Add a name field for hover text
-census_gdf['NAME'] = census_gdf.apply(
-    lambda row: f"{row['NAMELSAD']}",
-    axis=1
-)
+census_gdf['NAME'] = census_gdf['NAMELSAD']
+
+# PolicyEngine geoid (at-large districts and DC renumbered, as for the hex
+# map) and its row in snap_by_congressional_district.csv and the data bundle
+census_gdf['cd_id'] = census_gdf['GEOID'].astype(int).replace(single_district_states)
+district_index = load_district_geometry().set_index('cd_id')['district_index']
+census_gdf['district_index'] = census_gdf['cd_id'].map(district_index)
+missing = census_gdf.loc[census_gdf['district_index'].isna(), 'GEOID'].tolist()
+if missing:
+    raise ValueError(f"Census districts missing from the hex district geometry: {missing}")
+census_gdf['district_index'] = census_gdf['district_index'].astype(int)
+
+# Keep only the properties the pages read
+properties = ['STATEFP', 'CD118FP', 'GEOID', 'NAMELSAD', 'STATE', 'CD', 'NAME', 'cd_id', 'district_index']
+census_gdf = census_gdf[properties + ['geometry']].reset_index(drop=True)
+
+# Build the topology once: borders between neighboring districts become
+# single shared arcs, so simplifying an arc moves both sides together and
+# no slivers or gaps open up between districts
+# (coordinates are snapped to a 1e6 grid first so that borders digitized
+# with tiny floating point differences are still recognized as shared)
+topology = topojson.Topology(census_gdf, prequantize=1e6, object_name='districts')
+
+overview = topology.toposimplify(OVERVIEW['tolerance'], prevent_oversimplify=True)
+overview = overview.topoquantize(OVERVIEW['quantization'])
+with open(overview_path, 'w') as f:
+    json.dump(overview.to_dict(), f, separators=(',', ':'))
+print(f"Saved overview (tolerance {OVERVIEW['tolerance']} degrees) as: {overview_path}")
+
+
+def tile_xy(lon, lat, zoom):
+    """XYZ (web mercator) tile containing a point."""
+    n = 2 ** zoom
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def clockwise(geometry):
+    """Exterior rings clockwise, as Plotly's d3 renderer expects."""
+    if geometry.geom_type == 'Polygon':
+        return orient(geometry, sign=-1.0)
+    return shapely.MultiPolygon([orient(part, sign=-1.0) for part in geometry.geoms])
+
+
+# Each district is stored whole, once per zoom, in the tile containing its
+# representative point, so tiles have no cut edges to show as seams. The
+# index lists every district's bounding box and home tiles; the pages fetch
+# the tiles of the districts that intersect the view.
+if os.path.isdir(tiles_dir):
+    shutil.rmtree(tiles_dir)
+points = census_gdf.geometry.representative_point()
+index = {
+    'zooms': {str(zoom): {'min_scale': settings['min_scale']} for zoom, settings in TILE_ZOOMS.items()},
+    'districts': [],
+}
+home_tiles = {zoom: [tile_xy(point.x, point.y, zoom) for point in points] for zoom in TILE_ZOOMS}
+for row, (bounds, geoid) in enumerate(zip(census_gdf.geometry.bounds.values, census_gdf['GEOID'])):
+    index['districts'].append({
+        'GEOID': geoid,
+        'bbox': [round(value, 4) for value in bounds],
+        'tiles': {str(zoom): home_tiles[zoom][row] for zoom in TILE_ZOOMS},
+    })
+
+tile_count = 0
+for zoom, settings in TILE_ZOOMS.items():
+    simplified = topology.toposimplify(settings['tolerance'], prevent_oversimplify=True).to_gdf()
+    records = simplified[properties].to_dict('records')
+    tiles = {}
+    for row, geometry in enumerate(simplified.geometry):
+        # Rounding to one global grid keeps shared borders identical
+        geometry = shapely.transform(clockwise(geometry), lambda xy: np.round(xy, settings['decimals']))
+        tiles.setdefault(home_tiles[zoom][row], []).append({
+            'type': 'Feature',
+            'properties': records[row],
+            'geometry': mapping(geometry),
+        })
+    for (x, y), features in tiles.items():
+        path = os.path.join(tiles_dir, str(zoom), str(x), f'{y}.geojson')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': features}, f, separators=(',', ':'))
+    tile_count += len(tiles)
+    print(f"Saved zoom {zoom} (tolerance {settings['tolerance']} degrees) as {len(tiles)} tiles")
 
-# Convert to GeoJSON
-census_gdf.to_file('real_congressional_districts.geojson', driver='GeoJSON')
+with open(os.path.join(tiles_dir, 'index.json'), 'w') as f:
+    json.dump(index, f, separators=(',', ':'))
 
-print(f"Converted {len(census_gdf)} districts to GeoJSON")
-print(f"Saved as: real_congressional_districts.geojson")
+print(f"Converted {len(census_gdf)} districts to a TopoJSON overview and {tile_count} tiles in {tiles_dir}/")
 
 # Print some sample data to verify
 print("\nSample districts:")
@@ -0,0 +1,318 @@
+"""Binary district bundle for the web maps.
+
+One file holds everything the map pages need for the hex view: every
+numeric column of snap_by_congressional_district.csv as a typed array, the
+hex geometry as flat coordinate and offset arrays, and state and district
+labels, all in district_index order (the CSV's cd_id order). The pages
+wrap each array in a Float32Array/Uint16Array view of the fetched buffer,
+so nothing is parsed or joined in JavaScript.
+
+Layout (little-endian):
+    4 bytes   magic b'SNDB'
+    uint32    BUNDLE_VERSION
+    uint32    manifest length in bytes
+    manifest  UTF-8 JSON: version, n_districts, labels, and for each array
+              its dtype, length, unit and byte offset from the end of the
+              manifest, which is padded to an 8-byte boundary
+    arrays    each starting on an 8-byte boundary
+
+For every metric column the manifest also carries quantile and Jenks
+natural-break color bins and national and per-state summaries, and the
+arrays include <column>_rank (1 = highest) and <column>_percentile, so a
+page can switch metrics without computing anything.
+
+Hex geometry is stored as hex_coordinates (x, y pairs), hex_ring_offsets
+(first point of each ring), hex_polygon_offsets (first ring of each
+polygon) and hex_district_offsets (first polygon of each district); each
+offset array has one extra entry at the end.
+
+Example:
+    python district_bundle.py
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from district_dataset import UNITS
+from district_geometry import load_district_geometry
+
+
+# Bump when the layout or the set of arrays changes
+BUNDLE_VERSION = 2
+MAGIC = b'SNDB'
+bundle_path = 'snap_district_bundle.bin'
+csv_path = 'snap_by_congressional_district.csv'
+
+# Integer columns keep exact integer types; every other column is float32
+COLUMN_DTYPES = {
+    'congressional_district_geoid': np.uint16,
+    'state_fips': np.uint8,
+}
+
+# Number of color bins, one per stop of the pages' colorscales
+N_CLASSES = 6
+SUMMARY_STATS = ('total', 'mean', 'median', 'min', 'max')
+
+
+def jenks_breaks(values, n_classes=N_CLASSES):
+    """Fisher-Jenks natural breaks, minimizing within-class variance.
+
+    Exact dynamic program over the sorted values; O(n_classes * n**2),
+    which is instant for a few hundred districts.
+
+    Args:
+        values: Values to classify; NaNs are ignored
+        n_classes: Number of classes
+
+    Returns:
+        List of n_classes + 1 class bounds, from the minimum to the maximum
+        (fewer if there are fewer distinct values)
+    """
+    values = np.sort(np.asarray(values, dtype=float))
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return []
+    n_classes = min(n_classes, len(np.unique(values)))
+    n = len(values)
+    sums = np.r_[0.0, np.cumsum(values)]
+    squares = np.r_[0.0, np.cumsum(values ** 2)]
+
+    def cost(start, end):
+        # Sum of squared deviations of values[start:end] for each start
+        count = end - start
+        total = sums[end] - sums[start]
+        return squares[end] - squares[start] - total ** 2 / count
+
+    # best[k, j]: lowest cost of splitting values[:j] into k + 1 classes
+    best = np.full((n_classes, n + 1), np.inf)
+    split = np.zeros((n_classes, n + 1), dtype=np.int64)
+    best[0, 1:] = cost(np.zeros(n, dtype=np.int64), np.arange(1, n + 1))
+    for k in range(1, n_classes):
+        for j in range(k + 1, n + 1):
+            starts = np.arange(k, j)
+            candidates = best[k - 1, starts] + cost(starts, j)
+            split[k, j] = starts[np.argmin(candidates)]
+            best[k, j] = candidates.min()
+
+    bounds = [values[-1]]
+    end = n
+    for k in range(n_classes - 1, 0, -1):
+        end = split[k, end]
+        bounds.append(values[end - 1])
+    bounds.append(values[0])
+    return [significant(bound) for bound in reversed(bounds)]
+
+
+def quantile_breaks(values, n_classes=N_CLASSES):
+    """Class bounds putting an equal number of districts in each class."""
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return []
+    return [significant(bound) for bound in np.quantile(values, np.linspace(0, 1, n_classes + 1))]
+
+
+def is_additive(column):
+    """Whether district values of a column sum to a state or national total."""
+    return (UNITS.get(column) in ('persons', 'households', 'USD per year')
+            and not column.startswith('median_'))
+
+
+def significant(value, digits=7):
+    """Round to significant digits for the manifest; NaN becomes None."""
+    return None if pd.isna(value) else float(f'{value:.{digits}g}')
+
+
+def summarize(values):
+    """Total (None if not additive), mean, median, min and max of a column."""
+    values = values.dropna()
+    if values.empty:
+        return dict.fromkeys(SUMMARY_STATS)
+    return {
+        'total': significant(values.sum()) if is_additive(values.name) else None,
+        'mean': significant(values.mean()),
+        'median': significant(values.median()),
+        'min': significant(values.min()),
+        'max': significant(values.max()),
+    }
+
+
+def metric_tables(district_df):
+    """Color bins, summaries, ranks and percentiles for each metric column.
+
+    Args:
+        district_df: District table as written to the CSV
+
+    Returns:
+        Tuple of (dict of column -> manifest entry with quantile_breaks,
+        jenks_breaks, a national summary and per-state summaries stored
+        column-wise, dict of rank and percentile arrays)
+    """
+    metrics = {}
+    arrays = {}
+    for column in district_df.columns:
+        if column in COLUMN_DTYPES or not pd.api.types.is_numeric_dtype(district_df[column]):
+            continue
+        values = district_df[column]
+        states = {fips: summarize(state_values) for fips, state_values in values.groupby(district_df['state_fips'])}
+        metrics[column] = {
+            'quantile_breaks': quantile_breaks(values),
+            'jenks_breaks': jenks_breaks(values),
+            'national': summarize(values),
+            'states': {
+                'state_fips': [int(fips) for fips in states],
+                **{stat: [summary[stat] for summary in states.values()] for stat in SUMMARY_STATS},
+            },
+        }
+        # Rank 1 is the highest value; percentile is the share of districts
+        # at or below the value
+        arrays[f'{column}_rank'] = values.rank(ascending=False, method='min').fillna(0).values.astype(np.uint16)
+        arrays[f'{column}_percentile'] = (values.rank(pct=True, method='max') * 100).values.astype(np.float32)
+    return metrics, arrays
+
+
+def hex_geometry_arrays(geometry):
+    """Flatten (multi)polygons into coordinate and offset arrays.
+
+    Args:
+        geometry: Polygon or MultiPolygon per district, in district order
+
+    Returns:
+        Dict of hex_coordinates, hex_ring_offsets, hex_polygon_offsets and
+        hex_district_offsets arrays
+    """
+    polygons = [list(g.geoms) if g.geom_type == 'MultiPolygon' else [g] for g in geometry]
+    rings = [[polygon.exterior, *polygon.interiors] for parts in polygons for polygon in parts]
+    ring_sizes = [len(ring.coords) for polygon_rings in rings for ring in polygon_rings]
+    return {
+        'hex_coordinates': np.concatenate([
+            np.asarray(ring.coords)[:, :2] for polygon_rings in rings for ring in polygon_rings
+        ]).astype(np.float32).ravel(),
+        'hex_ring_offsets': np.r_[0, np.cumsum(ring_sizes)].astype(np.uint32),
+        'hex_polygon_offsets': np.r_[0, np.cumsum([len(r) for r in rings])].astype(np.uint32),
+        'hex_district_offsets': np.r_[0, np.cumsum([len(p) for p in polygons])].astype(np.uint32),
+    }
+
+
+def build_bundle(district_df, geometry_gdf):
+    """Arrays and labels for the bundle, checked to be in the same order.
+
+    Args:
+        district_df: District table as written to the CSV
+        geometry_gdf: District geometry from load_district_geometry
+
+    Returns:
+        Tuple of (dict of name -> array, dict of name -> list of labels,
+        dict of metric column -> color bins and summaries)
+
+    Raises:
+        ValueError: If the table and geometry don't list the same districts
+            in the same order
+    """
+    geoids = district_df['congressional_district_geoid'].values
+    if not np.array_equal(geoids, geometry_gdf['cd_id'].values):
+        raise ValueError(
+            "District table and geometry list different districts; rerun "
+            "snap_districts.py or district_geometry.py"
+        )
+
+    arrays = {}
+    for column in district_df.columns:
+        if pd.api.types.is_numeric_dtype(district_df[column]):
+            arrays[column] = district_df[column].values.astype(COLUMN_DTYPES.get(column, np.float32))
+    metrics, metric_arrays = metric_tables(district_df)
+    arrays.update(metric_arrays)
+    arrays.update(hex_geometry_arrays(shapely.force_2d(geometry_gdf.geometry.values)))
+
+    labels = {
+        'state_abbrev': geometry_gdf['STATEAB'].tolist(),
+        'state_name': geometry_gdf['STATENAME'].tolist(),
+        'district_label': geometry_gdf['CDLABEL'].astype(str).tolist(),
+    }
+    return arrays, labels, metrics
+
+
+def array_unit(name):
+    """Unit of a bundle array, from UNITS for district columns."""
+    if name.endswith('_rank'):
+        return 'rank'
+    if name.endswith('_percentile'):
+        return 'percent'
+    return UNITS.get(name.removesuffix('_se'))
+
+
+def write_bundle(arrays, labels, metrics, path=bundle_path):
+    """Write arrays, labels and metric tables in the bundle layout.
+
+    Args:
+        arrays: Dict of name -> 1-D numpy array
+        labels: Dict of name -> list of strings, one per district
+        metrics: Dict of metric column -> color bins and summaries
+        path: Output path
+    """
+    entries = {}
+    offset = 0
+    for name, values in arrays.items():
+        entries[name] = {
+            'dtype': values.dtype.name,
+            'offset': offset,
+            'length': len(values),
+            'unit': array_unit(name),
+        }
+        offset += -(-values.nbytes // 8) * 8
+
+    n_districts = len(next(iter(labels.values())))
+    manifest = {
+        'version': BUNDLE_VERSION,
+        'n_districts': n_districts,
+        'labels': labels,
+        'metrics': metrics,
+        'arrays': entries,
+    }
+    encoded = json.dumps(manifest, separators=(',', ':')).encode()
+    encoded += b' ' * (-(12 + len(encoded)) % 8)
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<II', BUNDLE_VERSION, len(encoded)) + encoded)
+        for name, values in arrays.items():
+            data = values.astype(values.dtype.newbyteorder('<'), copy=False).tobytes()
+            f.write(data + b'\0' * (-len(data) % 8))
+    os.replace(tmp_path, path)
+
+
+def read_bundle(path=bundle_path):
+    """Read a bundle back as numpy arrays.
+
+    Returns:
+        Tuple of (manifest dict, dict of name -> array)
+
+    Raises:
+        ValueError: If the file isn't a bundle of BUNDLE_VERSION
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, (version, manifest_length) = data[:4], struct.unpack('<II', data[4:12])
+    if magic != MAGIC or version != BUNDLE_VERSION:
+        raise ValueError(f"{path} is not a version {BUNDLE_VERSION} district bundle")
+    manifest = json.loads(data[12:12 + manifest_length])
+    start = 12 + manifest_length
+    arrays = {
+        name: np.frombuffer(data, np.dtype(entry['dtype']).newbyteorder('<'), entry['length'],
+                            start + entry['offset'])
+        for name, entry in manifest['arrays'].items()
+    }
+    return manifest, arrays
+
+
+if __name__ == '__main__':
+    district_df = pd.read_csv(csv_path)
+    arrays, labels, metrics = build_bundle(district_df, load_district_geometry())
+    write_bundle(arrays, labels, metrics)
+    print(f"Wrote {len(district_df)} districts and {len(arrays)} arrays to {bundle_path} "
+          f"({os.path.getsize(bundle_path) / 1e3:,.0f} KB, version {BUNDLE_VERSION})")
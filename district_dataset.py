@@ -0,0 +1,116 @@
+"""Typed, partitioned Arrow dataset of district results.
+
+District tables are written as uncompressed Arrow IPC (Feather v2) files
+partitioned as scenario=<name>/period=<period>/state_fips=<fips>/, so
+readers can memory-map them and load only the columns and partitions
+they need. Each file's schema carries column units plus the calibration
+factor and source dataset of the run that wrote it.
+"""
+
+import json
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs
+
+
+dataset_dir = 'snap_district_dataset'
+
+PARTITIONING = ds.partitioning(
+    pa.schema([('scenario', pa.string()), ('period', pa.string()), ('state_fips', pa.int32())]),
+    flavor='hive',
+)
+
+UNITS = {
+    'congressional_district_geoid': 'geoid',
+    'snap_population': 'persons',
+    'snap_under_18': 'persons',
+    'snap_over_65': 'persons',
+    'snap_employed': 'persons',
+    'household_weight': 'households',
+    'median_household_income': 'USD per year',
+    'total_weighted_snap': 'USD per year',
+    'one_sum_test': 'households',
+    'pct_under_18': 'percent',
+    'pct_over_65': 'percent',
+    'employment_rate': 'percent',
+    'uncalibrated_weighted_snap': 'USD per year',
+}
+
+
+def write_district_dataset(district_df, scenario, period, calibration_factor, source_dataset,
+                           root=dataset_dir):
+    """Write one scenario/period's calibrated district table.
+
+    Existing files for the same scenario, period and states are replaced;
+    other partitions are left alone.
+
+    Args:
+        district_df: Calibrated district table with a state_fips column
+        scenario: Scenario name, e.g. "baseline"
+        period: Period label
+        calibration_factor: Benefit scaling applied to the table
+        source_dataset: Dataset path pattern the table was built from
+        root: Dataset directory
+    """
+    table = pa.Table.from_pandas(district_df, preserve_index=False)
+    table = table.append_column('scenario', pa.array([scenario] * len(table), pa.string()))
+    table = table.append_column('period', pa.array([str(period)] * len(table), pa.string()))
+    table = table.set_column(table.schema.get_field_index('state_fips'), 'state_fips',
+                             table['state_fips'].cast(pa.int32()))
+
+    # A <column>_se standard error has the unit of its column
+    fields = [
+        field.with_metadata({'unit': UNITS[field.name.removesuffix('_se')]})
+        if field.name.removesuffix('_se') in UNITS else field
+        for field in table.schema
+    ]
+    schema = pa.schema(fields, metadata={
+        'calibration_factor': json.dumps(calibration_factor),
+        'source_dataset': source_dataset,
+        'scenario': scenario,
+        'period': str(period),
+    })
+
+    ds.write_dataset(
+        table.cast(schema),
+        root,
+        format='ipc',
+        partitioning=PARTITIONING,
+        existing_data_behavior='delete_matching',
+        basename_template='part-{i}.arrow',
+    )
+
+
+def read_district_dataset(columns=None, scenario='baseline', period=None, root=dataset_dir):
+    """Read district rows, memory-mapping the Arrow files.
+
+    Args:
+        columns: Columns to load, or None for all
+        scenario: Scenario to select, or None for all
+        period: Period label to select, or None for all
+        root: Dataset directory
+
+    Returns:
+        pandas DataFrame
+    """
+    dataset = ds.dataset(root, format='ipc', partitioning=PARTITIONING,
+                         filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True))
+    condition = None
+    for name, value in [('scenario', scenario), ('period', period)]:
+        if value is not None:
+            term = ds.field(name) == str(value)
+            condition = term if condition is None else condition & term
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def read_metadata(scenario='baseline', period=None, root=dataset_dir):
+    """Schema metadata (calibration factor, source dataset) of a scenario."""
+    dataset = ds.dataset(root, format='ipc', partitioning=PARTITIONING)
+    for fragment in dataset.get_fragments():
+        metadata = {key.decode(): value.decode()
+                    for key, value in (fragment.physical_schema.metadata or {}).items()}
+        if metadata.get('scenario') == scenario and (period is None or metadata.get('period') == str(period)):
+            metadata['calibration_factor'] = json.loads(metadata['calibration_factor'])
+            return metadata
+    return None
@@ -0,0 +1,132 @@
+"""Canonical hex district geometry, built once from the shapefiles.
+
+Voting districts from HexCDv31 and DC from HexDDv20 are combined, cd_id is
+resolved to PolicyEngine's congressional_district_geoid (at-large
+districts and DC renumbered), and rows are sorted by cd_id, which is the
+row order of snap_by_congressional_district.csv, and numbered with
+district_index. The result is stored as GeoParquet, which loads in a few
+milliseconds. Its schema metadata records GEOMETRY_VERSION and a hash of
+the source shapefiles, and load_district_geometry rebuilds it if either
+has changed.
+
+Example:
+    python district_geometry.py
+"""
+
+import hashlib
+import json
+import os
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+# Bump when the build below changes what the artifact contains
+GEOMETRY_VERSION = 1
+geometry_path = 'district_geometry.parquet'
+
+VOTING_SHAPEFILE = 'HexCDv31/HexCDv31.shp'
+NONVOTING_SHAPEFILE = 'HexDDv20/HexDDv20.shp'
+SOURCE_FILES = [VOTING_SHAPEFILE, 'HexCDv31/HexCDv31.dbf',
+                NONVOTING_SHAPEFILE, 'HexDDv20/HexDDv20.dbf']
+
+# DC's GEOID among the non-voting delegate districts
+DC_GEOID = '1198'
+
+# Fix single-district state mappings (at-large districts)
+single_district_states = {
+    200: 201,   # Alaska
+    1000: 1001, # Delaware
+    3800: 3801, # North Dakota
+    4600: 4601, # South Dakota
+    5000: 5001, # Vermont
+    5600: 5601, # Wyoming
+    1198: 1101  # DC (from 1198 in shapefile to 1101 in PolicyEngine data)
+}
+
+
+def source_hash():
+    """sha256 of the source shapefiles' geometry and attribute files."""
+    digest = hashlib.sha256()
+    for path in SOURCE_FILES:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def build_district_geometry():
+    """Combine the hex shapefiles into one GeoDataFrame keyed by cd_id.
+
+    Returns:
+        GeoDataFrame sorted by cd_id with a district_index column
+    """
+    hex_gdf = gpd.read_file(VOTING_SHAPEFILE)
+
+    # Filter for DC only and add the voting districts' label columns
+    nonvoting_gdf = gpd.read_file(NONVOTING_SHAPEFILE)
+    dc_gdf = nonvoting_gdf[nonvoting_gdf['GEOID'] == DC_GEOID].copy()
+    dc_gdf['STATEAB'] = dc_gdf['ABBREV']
+    dc_gdf['STATENAME'] = dc_gdf['NAME']
+    dc_gdf['CDLABEL'] = dc_gdf['ABBREV']
+
+    combined_gdf = pd.concat([hex_gdf, dc_gdf], ignore_index=True)
+    combined_gdf['cd_id'] = combined_gdf['GEOID'].astype(int).replace(single_district_states)
+    combined_gdf = combined_gdf.sort_values('cd_id', ignore_index=True)
+    combined_gdf.insert(0, 'district_index', range(len(combined_gdf)))
+    return combined_gdf
+
+
+def write_district_geometry(path=geometry_path):
+    """Build the geometry and write it as GeoParquet with version metadata.
+
+    Returns:
+        The GeoDataFrame that was written
+    """
+    geometry_gdf = build_district_geometry()
+    tmp_path = f'{path}.tmp'
+    geometry_gdf.to_parquet(tmp_path, index=False)
+    # Add the version next to the GeoParquet "geo" metadata
+    table = pq.read_table(tmp_path)
+    metadata = {
+        **table.schema.metadata,
+        b'district_geometry': json.dumps({
+            'version': GEOMETRY_VERSION,
+            'source_hash': source_hash(),
+        }).encode(),
+    }
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, path)
+    return geometry_gdf
+
+
+def geometry_metadata(path=geometry_path):
+    """Version and source hash stored in an artifact, or None if absent."""
+    if not os.path.exists(path):
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    if b'district_geometry' not in metadata:
+        return None
+    return json.loads(metadata[b'district_geometry'])
+
+
+def load_district_geometry(path=geometry_path):
+    """Load the district geometry, rebuilding it first if missing or stale.
+
+    Args:
+        path: GeoParquet artifact path
+
+    Returns:
+        GeoDataFrame with district_index, cd_id, GEOID, STATEAB,
+        STATENAME, CDLABEL and geometry, sorted by cd_id
+    """
+    metadata = geometry_metadata(path)
+    if metadata != {'version': GEOMETRY_VERSION, 'source_hash': source_hash()}:
+        print(f"Building {path} from {VOTING_SHAPEFILE} and {NONVOTING_SHAPEFILE}")
+        return write_district_geometry(path)
+    return gpd.read_parquet(path)
+
+
+if __name__ == '__main__':
+    geometry_gdf = write_district_geometry()
+    print(f"Wrote {len(geometry_gdf)} districts to {geometry_path} (version {GEOMETRY_VERSION})")
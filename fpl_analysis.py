@@ -0,0 +1,255 @@
+"""Helpers behind snap_above_130fpl_analysis.ipynb.
+
+The notebook asks for the same few variables (snap, the gross and net
+income FPG ratios) at person and SPM unit level from several cells.
+VariableCache memoizes each sim.calculate result by (variable, period,
+map_to), so re-running cells or trying new FPL thresholds reuses the
+arrays instead of recomputing or remapping them. Entries are evicted least
+recently used first once their combined size passes a byte budget.
+
+shares_above answers "what share of recipients or benefits is above x%
+FPL" for any number of thresholds, nationally or per district, from one
+sort of the data. cumulative_curve uses it to resample the cumulative
+distribution onto a few thousand points for plotting.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+PERIOD = '2025-10'
+
+
+def result_bytes(result):
+    """Approximate memory held by a calculate() result and its weights."""
+    size = np.asarray(result).nbytes
+    weights = getattr(result, 'weights', None)
+    if weights is not None:
+        size += np.asarray(weights).nbytes
+    return size
+
+
+class VariableCache:
+    """Memoized, lazily simulated access to Microsimulation.calculate.
+
+    Args:
+        sim: Simulation to calculate from, or None to build the default
+            Microsimulation on the first cache miss
+        max_bytes: Memory budget for cached results (default: 2 GiB)
+    """
+
+    def __init__(self, sim=None, max_bytes=2 * 2**30):
+        self._sim = sim
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def sim(self):
+        if self._sim is None:
+            from policyengine_us import Microsimulation
+
+            self._sim = Microsimulation()
+        return self._sim
+
+    def calculate(self, variable, period=PERIOD, map_to=None):
+        """sim.calculate(variable, period, map_to=map_to), memoized.
+
+        Results larger than the whole budget are returned but not kept.
+        """
+        key = (variable, str(period), map_to)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key][0]
+
+        self.misses += 1
+        result = self.sim.calculate(variable, period=period, map_to=map_to)
+        size = result_bytes(result)
+        if size <= self.max_bytes:
+            self.entries[key] = (result, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+        return result
+
+    def clear(self):
+        """Drop every cached result."""
+        self.entries.clear()
+        self.bytes = 0
+
+    def __repr__(self):
+        return (f"VariableCache({len(self.entries)} results, {self.bytes / 2**20:,.1f} of "
+                f"{self.max_bytes / 2**20:,.0f} MiB, {self.hits} hits, {self.misses} misses)")
+
+
+def shares_above(ratio, weights, thresholds, groups=None):
+    """Weighted share of rows with ratio above each threshold.
+
+    Rows are sorted once, by ratio and then by group, and the weighted cumsum
+    is searched for every (group, threshold) pair in a single
+    np.searchsorted call, so hundreds of thresholds across hundreds of
+    districts cost about as much as one.
+
+    Args:
+        ratio: Value per row, e.g. income as a ratio of FPG
+        weights: Weight per row; rows with NaN ratios are ignored
+        thresholds: Thresholds to evaluate, in any order
+        groups: Optional group key per row, e.g. congressional district
+
+    Returns:
+        Array of shares, one per threshold; with groups, a tuple of
+        (unique group keys, groups x thresholds array of shares)
+    """
+    ratio = np.asarray(ratio, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    thresholds = np.asarray(thresholds, dtype=float)
+    valid = ~np.isnan(ratio)
+    if groups is None:
+        keys, group_index = np.zeros(1), np.zeros(valid.sum(), dtype=np.int64)
+    else:
+        keys, group_index = np.unique(np.asarray(groups)[valid], return_inverse=True)
+    ratio = ratio[valid]
+    weights = weights[valid]
+
+    # The one full sort: dense rank of each ratio, and the number of
+    # distinct ratios at or below each threshold
+    order = np.argsort(ratio)
+    sorted_ratio = ratio[order]
+    sorted_rank = np.r_[0, np.cumsum(sorted_ratio[1:] != sorted_ratio[:-1])].astype(np.int64)
+    n_values = sorted_rank[-1] + 1 if len(sorted_rank) else 1
+    below = np.searchsorted(sorted_ratio, thresholds, side='right')
+    threshold_rank = np.r_[0, sorted_rank + 1][below]
+
+    # A stable regroup of the ratio order (a radix sort for small integer
+    # keys) puts rows in (group, rank) order, and (group, rank) as one
+    # integer key lets one cumsum and one searchsorted serve every group
+    if groups is not None:
+        regroup = np.argsort(group_index[order].astype(np.min_scalar_type(len(keys))), kind='stable')
+        order, sorted_rank = order[regroup], sorted_rank[regroup]
+    sorted_key = group_index[order] * n_values + sorted_rank
+    cumulative = np.r_[0.0, np.cumsum(weights[order])]
+
+    group_base = np.arange(len(keys))[:, None] * n_values
+    start = cumulative[np.searchsorted(sorted_key, group_base)]
+    end = cumulative[np.searchsorted(sorted_key, group_base + n_values)]
+    at_or_below = cumulative[np.searchsorted(sorted_key, group_base + threshold_rank)]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = (end - at_or_below) / (end - start)
+
+    if groups is None:
+        return shares[0]
+    return keys, shares
+
+
+def snap_rows(cache, entity, period=PERIOD, by=None):
+    """Income ratios and weights of SNAP recipients or benefits.
+
+    Args:
+        cache: VariableCache to calculate from
+        entity: 'person' for recipients, each counted once by person
+            weight, or 'spm_unit' for benefits, weighted by amount
+        period: Period to calculate
+        by: Optional variable to return per row as well
+
+    Returns:
+        Tuple of (ratio, weights, by values or None) for receiving rows
+    """
+    snap = np.asarray(cache.calculate('snap', period, entity), dtype=float)
+    ratio = cache.calculate('snap_gross_income_fpg_ratio', period, entity)
+    weights = np.asarray(ratio.weights, dtype=float)
+    if entity == 'spm_unit':
+        weights = weights * snap
+    receiving = snap > 0
+    groups = None if by is None else np.asarray(cache.calculate(by, period, entity))[receiving]
+    return np.asarray(ratio, dtype=float)[receiving], weights[receiving], groups
+
+
+def fpl_shares(cache, thresholds, period=PERIOD, by=None):
+    """Share of SNAP recipients and benefits above each gross income threshold.
+
+    Recipients are people in SNAP units; benefits are SPM unit SNAP amounts
+    weighted by SPM unit weight. Income is snap_gross_income_fpg_ratio, a
+    ratio (1.3 is 130% FPL).
+
+    Args:
+        cache: VariableCache to calculate from
+        thresholds: Income-to-FPG ratio thresholds
+        period: Period to calculate
+        by: Optional variable to break the shares down by, e.g.
+            'congressional_district_geoid'
+
+    Returns:
+        DataFrame with threshold, recipient_share and benefit_share
+        columns, plus a column for the by variable if given
+    """
+    tables = {}
+    for name, entity in [('recipient_share', 'person'), ('benefit_share', 'spm_unit')]:
+        ratio, weights, groups = snap_rows(cache, entity, period, by)
+        shares = shares_above(ratio, weights, thresholds, groups)
+        if by is None:
+            tables[name] = pd.DataFrame({'threshold': thresholds, name: shares})
+        else:
+            keys, shares = shares
+            tables[name] = pd.DataFrame({
+                by: np.repeat(keys, len(thresholds)),
+                'threshold': np.tile(thresholds, len(keys)),
+                name: shares.ravel(),
+            })
+
+    on = ['threshold'] if by is None else [by, 'threshold']
+    return tables['recipient_share'].merge(tables['benefit_share'], on=on, how='outer')
+
+
+def cumulative_curve(ratio, weights, x_range=(0, 3), n_points=2000):
+    """Weighted cumulative distribution resampled to a few thousand points.
+
+    The curve is evaluated on an even grid across x_range (the plotted
+    range, where a grid step is well under a pixel) merged with n_points
+    weighted quantiles, which keep its shape outside that range. Plotting
+    these points gives the same line as plotting every row.
+
+    Args:
+        ratio: Value per row
+        weights: Weight per row
+        x_range: (low, high) range of ratio to sample evenly
+        n_points: Points in the even grid, and number of quantiles
+
+    Returns:
+        DataFrame with income_pct (ratio x 100) and cumsum_pct, the percent
+        of weight at or below it
+    """
+    ratio = np.asarray(ratio, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    valid = ~np.isnan(ratio)
+    ratio, weights = ratio[valid], weights[valid]
+    if not len(ratio):
+        return pd.DataFrame({'income_pct': [], 'cumsum_pct': []})
+
+    order = np.argsort(ratio)
+    cumulative = np.cumsum(weights[order])
+    levels = np.linspace(0, cumulative[-1], n_points)
+    quantiles = ratio[order][np.minimum(np.searchsorted(cumulative, levels), len(ratio) - 1)]
+    low = max(x_range[0], ratio[order[0]])
+    high = min(x_range[1], ratio[order[-1]])
+    grid = np.unique(np.r_[np.linspace(low, high, n_points) if low < high else [], quantiles])
+
+    return pd.DataFrame({
+        'income_pct': grid * 100,
+        'cumsum_pct': (1 - shares_above(ratio, weights, grid)) * 100,
+    })
+
+
+def fpl_curves(cache, period=PERIOD, x_range=(0, 3), n_points=2000):
+    """Cumulative recipient and benefit curves by gross income, downsampled.
+
+    Returns:
+        Tuple of (recipients, benefits) cumulative_curve DataFrames
+    """
+    return tuple(cumulative_curve(*snap_rows(cache, entity, period)[:2], x_range, n_points)
+                 for entity in ['person', 'spm_unit'])
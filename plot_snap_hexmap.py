@@ -1,42 +1,27 @@
+import os
+
 import numpy as np
-import geopandas as gpd
 import matplotlib.pyplot as plt
 import pandas as pd
 
-# Load the SNAP data from CSV
-snap_df = pd.read_csv('snap_by_congressional_district.csv')
+from district_dataset import dataset_dir, read_district_dataset
+from district_geometry import load_district_geometry
+
+# Load the SNAP data, preferring the memory-mapped Arrow dataset (only the
+# columns used here) over re-parsing the CSV
+if os.path.isdir(dataset_dir):
+    snap_df = read_district_dataset(
+        columns=['congressional_district_geoid', 'state_fips', 'total_weighted_snap'],
+        scenario='baseline', period='default')
+else:
+    snap_df = pd.read_csv('snap_by_congressional_district.csv')
 
 # Convert benefits to millions for easier visualization
 snap_df['snap_millions'] = snap_df['total_weighted_snap'] / 1e6
 
-# Load the hexagon shapefile for voting districts
-hex_gdf = gpd.read_file('HexCDv31/HexCDv31.shp')
-hex_gdf['cd_id'] = hex_gdf['GEOID'].astype(int)
-
-# Load non-voting districts shapefile and extract only DC
-nonvoting_gdf = gpd.read_file('HexDDv20/HexDDv20.shp')
-# Filter for DC only (GEOID 1198)
-dc_gdf = nonvoting_gdf[nonvoting_gdf['GEOID'] == '1198'].copy()
-dc_gdf['cd_id'] = dc_gdf['GEOID'].astype(int)
-# Add state abbreviation column to match main shapefile structure
-dc_gdf['STATEAB'] = dc_gdf['ABBREV']
-dc_gdf['STATENAME'] = dc_gdf['NAME']
-dc_gdf['CDLABEL'] = dc_gdf['ABBREV']
-
-# Combine voting districts with DC only
-hex_gdf = pd.concat([hex_gdf, dc_gdf], ignore_index=True)
-
-# Fix single-district state mappings (at-large districts)
-single_district_states = {
-    200: 201,   # Alaska
-    1000: 1001, # Delaware
-    3800: 3801, # North Dakota
-    4600: 4601, # South Dakota
-    5000: 5001, # Vermont
-    5600: 5601, # Wyoming
-    1198: 1101  # DC (from 1198 in shapefile to 1101 in PolicyEngine data)
-}
-hex_gdf['cd_id'] = hex_gdf['cd_id'].replace(single_district_states)
+# Hex geometry for voting districts plus DC, with cd_id already resolved
+# (built once from the shapefiles by district_geometry.py)
+hex_gdf = load_district_geometry()
 
 # Merge SNAP data with shapefile
 merged_gdf = hex_gdf.merge(
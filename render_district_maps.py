@@ -0,0 +1,237 @@
+"""Batch rendering of static hex district maps.
+
+Renders one map per metric column x scenario/period in the district
+dataset (or the CSV, as the baseline), in any of PNG, SVG and PDF. The
+geometry is loaded once, and each worker process builds the figure, the
+hex PolyCollection and the colorbar once; every map after that only sets
+the collection's values, color limits and labels and saves. Maps of the
+same metric share one color range across scenarios and periods, so they
+can be compared side by side.
+
+Output goes to maps/<scenario>/<period>/<metric>.<format>.
+
+Example:
+    python render_district_maps.py --formats png svg pdf --workers 8
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.collections import PolyCollection
+from matplotlib.ticker import EngFormatter, FuncFormatter, PercentFormatter
+
+from district_dataset import UNITS, dataset_dir, read_district_dataset
+from district_geometry import load_district_geometry
+
+
+output_dir = 'maps'
+csv_path = 'snap_by_congressional_district.csv'
+FORMATS = ['png', 'svg', 'pdf']
+KEY_COLUMNS = ['congressional_district_geoid', 'state_fips', 'scenario', 'period']
+
+# Per-process renderer, built once by init_worker
+_renderer = None
+
+
+def hex_polygons(geometry_gdf):
+    """Exterior rings of every hex district, one per polygon part.
+
+    Args:
+        geometry_gdf: District geometry from load_district_geometry
+
+    Returns:
+        Tuple of (list of N x 2 coordinate arrays, district index of each)
+    """
+    polygons = []
+    districts = []
+    for index, geometry in enumerate(geometry_gdf.geometry):
+        parts = geometry.geoms if geometry.geom_type == 'MultiPolygon' else [geometry]
+        for part in parts:
+            polygons.append(np.asarray(part.exterior.coords)[:, :2])
+            districts.append(index)
+    return polygons, np.array(districts)
+
+
+def metric_label(metric):
+    """Colorbar label and tick formatter for a metric column."""
+    unit = UNITS.get(metric.removesuffix('_se'))
+    label = metric.replace('_', ' ').capitalize()
+    if unit == 'percent':
+        return f'{label} (%)', PercentFormatter(decimals=0)
+    if unit == 'USD per year':
+        engineering = EngFormatter(sep='')
+        return f'{label} ($ per year)', FuncFormatter(lambda value, _: f'${engineering(value)}')
+    return (f'{label} ({unit})' if unit else label), EngFormatter()
+
+
+class MapRenderer:
+    """One hex map figure, recolored and saved for each map.
+
+    Args:
+        polygons: Polygon coordinate arrays from hex_polygons
+        districts: District index of each polygon
+        cmap: Matplotlib colormap name; districts without data are gray
+        dpi: Resolution of raster output
+    """
+
+    def __init__(self, polygons, districts, cmap='YlOrRd', dpi=150):
+        self.districts = districts
+        self.dpi = dpi
+        self.fig, self.ax = plt.subplots(1, 1, figsize=(20, 12))
+        self.collection = PolyCollection(polygons, edgecolors='black', linewidths=0.3,
+                                         cmap=plt.get_cmap(cmap).with_extremes(bad='lightgray'))
+        self.collection.set_array(np.zeros(len(polygons)))
+        self.ax.add_collection(self.collection)
+        self.ax.autoscale_view()
+        # Same aspect correction geopandas applies to longitude/latitude
+        self.ax.set_aspect(1 / np.cos(np.radians(np.mean(self.ax.get_ylim()))))
+        self.ax.axis('off')
+        self.title = self.ax.set_title('', fontsize=20, fontweight='bold', pad=20)
+        self.colorbar = self.fig.colorbar(self.collection, ax=self.ax, orientation='horizontal',
+                                          shrink=0.8, pad=0.05)
+
+    def render(self, values, vmin, vmax, metric, title, paths):
+        """Recolor the districts and save the figure to each path.
+
+        Args:
+            values: Value per district, in district_index order
+            vmin: Lower end of the color range
+            vmax: Upper end of the color range
+            metric: Metric column, for the colorbar label
+            title: Figure title
+            paths: Output paths; the format follows each extension
+        """
+        self.collection.set_array(np.ma.masked_invalid(np.asarray(values, dtype=float)[self.districts]))
+        self.collection.set_clim(vmin, vmax)
+        label, formatter = metric_label(metric)
+        self.colorbar.set_label(label)
+        self.colorbar.formatter = formatter
+        self.colorbar.update_ticks()
+        self.title.set_text(title)
+        for path in paths:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.fig.savefig(path, dpi=self.dpi, bbox_inches='tight')
+
+
+def init_worker(polygons, districts, cmap, dpi):
+    global _renderer
+    _renderer = MapRenderer(polygons, districts, cmap, dpi)
+
+
+def render_job(job):
+    """Render one map with this process's renderer; returns its paths."""
+    _renderer.render(**job)
+    return job['paths']
+
+
+def load_tables(scenario=None, period=None):
+    """District rows for every scenario and period to render.
+
+    Reads the district dataset when present, otherwise the CSV as the
+    baseline scenario.
+
+    Returns:
+        DataFrame with scenario and period columns
+    """
+    if os.path.isdir(dataset_dir):
+        return read_district_dataset(scenario=scenario, period=period)
+    district_df = pd.read_csv(csv_path)
+    district_df['scenario'] = 'baseline'
+    district_df['period'] = 'default'
+    return district_df
+
+
+def map_jobs(district_df, geometry_gdf, metrics=None, formats=FORMATS, out_dir=output_dir):
+    """One job per metric x scenario/period, with values in geometry order.
+
+    Args:
+        district_df: Rows from load_tables
+        geometry_gdf: District geometry from load_district_geometry
+        metrics: Metric columns to render, or None for every numeric column
+        formats: Output formats
+        out_dir: Output directory
+
+    Returns:
+        List of keyword dicts for MapRenderer.render
+    """
+    if metrics is None:
+        metrics = [column for column in district_df.columns
+                   if column not in KEY_COLUMNS and pd.api.types.is_numeric_dtype(district_df[column])]
+    missing = [metric for metric in metrics if metric not in district_df.columns]
+    if missing:
+        raise ValueError(f"unknown metric columns: {', '.join(missing)}")
+
+    jobs = []
+    for metric in metrics:
+        # One color range per metric across every scenario and period
+        vmin, vmax = np.nanmin(district_df[metric]), np.nanmax(district_df[metric])
+        for (scenario, period), group in district_df.groupby(['scenario', 'period'], sort=True, observed=True):
+            values = (group.set_index('congressional_district_geoid')[metric]
+                      .reindex(geometry_gdf['cd_id']).values)
+            jobs.append({
+                'values': values,
+                'vmin': vmin,
+                'vmax': vmax,
+                'metric': metric,
+                'title': f"{metric.replace('_', ' ').capitalize()} by Congressional District\n"
+                         f"{scenario}, {period}",
+                'paths': [os.path.join(out_dir, str(scenario), str(period), f'{metric}.{fmt}')
+                          for fmt in formats],
+            })
+    return jobs
+
+
+def render_maps(jobs, polygons, districts, cmap='YlOrRd', dpi=150, workers=1):
+    """Render jobs serially or across worker processes.
+
+    Returns:
+        List of written paths
+    """
+    if workers > 1:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(polygons, districts, cmap, dpi)) as executor:
+            return [path for paths in executor.map(render_job, jobs, chunksize=chunksize)
+                    for path in paths]
+
+    init_worker(polygons, districts, cmap, dpi)
+    return [path for job in jobs for path in render_job(job)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render static hex maps for many metrics and scenarios")
+    parser.add_argument('--metrics', help="Comma-separated metric columns (default: all numeric columns)")
+    parser.add_argument('--scenario', help="Only this scenario (default: all)")
+    parser.add_argument('--period', help="Only this period (default: all)")
+    parser.add_argument('--formats', nargs='+', default=['png'], choices=FORMATS,
+                        help="Output formats (default: png)")
+    parser.add_argument('--dpi', type=int, default=150, help="Raster resolution (default: 150)")
+    parser.add_argument('--cmap', default='YlOrRd', help="Matplotlib colormap (default: YlOrRd)")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes (default: 1)")
+    parser.add_argument('--out-dir', default=output_dir, help=f"Output directory (default: {output_dir})")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    geometry_gdf = load_district_geometry()
+    district_df = load_tables(args.scenario, args.period)
+    metrics = args.metrics.split(',') if args.metrics else None
+    jobs = map_jobs(district_df, geometry_gdf, metrics, args.formats, args.out_dir)
+    polygons, districts = hex_polygons(geometry_gdf)
+
+    paths = render_maps(jobs, polygons, districts, args.cmap, args.dpi, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {len(jobs)} maps ({len(paths)} files) to {args.out_dir}/ in {elapsed:.1f}s "
+          f"({elapsed / max(len(jobs), 1):.2f}s per map)")
+
+
+if __name__ == '__main__':
+    main()
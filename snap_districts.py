@@ -1,8 +1,23 @@
+import argparse
+import hashlib
+import importlib.metadata
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
 
-from policyengine_us import Microsimulation
-from microdf import MicroDataFrame
+from calibration import load_targets, rake_weights, target_matrix
+from district_dataset import write_district_dataset
+from uncertainty import district_standard_errors
+from weighted_stats import grouped_weighted_medians
 
 
 states = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL',
@@ -11,153 +26,941 @@ states = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL',
           'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI',
           'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
 
+state_fips_codes = {
+    'AL': 1, 'AK': 2, 'AZ': 4, 'AR': 5, 'CA': 6, 'CO': 8, 'CT': 9, 'DE': 10,
+    'DC': 11, 'FL': 12, 'GA': 13, 'HI': 15, 'ID': 16, 'IL': 17, 'IN': 18,
+    'IA': 19, 'KS': 20, 'KY': 21, 'LA': 22, 'ME': 23, 'MD': 24, 'MA': 25,
+    'MI': 26, 'MN': 27, 'MS': 28, 'MO': 29, 'MT': 30, 'NE': 31, 'NV': 32,
+    'NH': 33, 'NJ': 34, 'NM': 35, 'NY': 36, 'NC': 37, 'ND': 38, 'OH': 39,
+    'OK': 40, 'OR': 41, 'PA': 42, 'RI': 44, 'SC': 45, 'SD': 46, 'TN': 47,
+    'TX': 48, 'UT': 49, 'VT': 50, 'VA': 51, 'WA': 53, 'WV': 54, 'WI': 55,
+    'WY': 56,
+}
+
+snap_target = 106744001279.0
+output_path = 'snap_by_congressional_district.csv'
+
+# weight_basis of a table on the survey weights with one national benefit
+# factor; raked tables are labelled by raked_weight_basis
+SURVEY_WEIGHTS = 'survey'
+
+# Extract dtypes. Ids fit int32, geoids (SSDD) fit uint16 and FIPS codes
+# uint8; money and weights only feed float64 sums and medians, so float32
+# storage keeps results within DTYPE_RTOL of a full-precision run
+HOUSEHOLD_SCHEMA = {
+    "household_id": "int32",
+    "household_weight": "float32",
+    "congressional_district_geoid": "uint16",
+    "state_fips": "uint8",
+    "household_market_income": "float32",
+    "snap": "float32",
+}
+PERSON_SCHEMA = {
+    "person_id": "int32",
+    "person_household_id": "int32",
+    "age": "uint8",
+    "employment_income": "float32",
+    "person_household_row": "int32",
+}
+# Row of each person's household in the household extract; not a model
+# variable, but projected from the simulation's household membership
+HOUSEHOLD_ROW = "person_household_row"
+HOUSEHOLD_VARIABLES = list(HOUSEHOLD_SCHEMA)
+PERSON_VARIABLES = [column for column in PERSON_SCHEMA if column != HOUSEHOLD_ROW]
+DTYPE_RTOL = 1e-5
+
+# Per-household person counts produced by roll_up_persons
+COUNT_COLUMNS = ['n_snap_recipients', 'n_snap_under_18', 'n_snap_over_65', 'n_snap_employed']
+# District columns scaled by the national calibration factor, along with
+# their <column>_se standard errors
+CALIBRATED_COLUMNS = ['total_weighted_snap']
+
+# Rough working-set bytes per person row during the roll-up: the extract
+# columns plus the position, mask and bincount temporaries
+PERSON_ROW_BYTES = 96
+# Cached person extracts are written in row groups this size so they can
+# be streamed back in bounded batches
+PARQUET_ROW_GROUP_ROWS = 250_000
+
+
+METRICS_ENV = 'SNAP_DISTRICTS_METRICS'
+
+
+class StageMetrics:
+    """Per-state, per-stage wall time, CPU time, peak RSS and row counts.
+
+    Each finished stage is appended to a JSON-lines file as one event, so
+    pool workers can record into the same file. With no path every stage
+    is a no-op.
+
+    peak_rss_mb is the stage's own peak resident memory: on Linux the
+    process's high-water mark (VmHWM) is reset through /proc/self/clear_refs
+    when a stage starts and read when it ends, and a stage enclosing other
+    stages takes the highest of their peaks too. Where the mark can't be
+    reset, it falls back to ru_maxrss, the peak since the process started,
+    and rss_scope says which one an event holds ('stage' or 'process').
+
+    Args:
+        path: JSON-lines file to append events to, or None to disable
+        run_id: Identifier shared by every event of one run
+    """
+
+    def __init__(self, path=None, run_id=None):
+        self.path = path
+        self.run_id = run_id or f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{os.getpid()}"
+        # Highest RSS (MB) seen so far by each open stage, innermost last
+        self._open_peaks = []
+
+    @staticmethod
+    def _reset_peak_rss():
+        """Reset the process's RSS high-water mark; False if unsupported."""
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _peak_rss_mb():
+        """Process RSS high-water mark in MB since the last reset."""
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+        raise OSError("no VmHWM in /proc/self/status")
+
+    def _fold_peak_rss(self):
+        """Fold the high-water mark into every open stage's peak."""
+        peak = self._peak_rss_mb()
+        self._open_peaks = [max(open_peak, peak) for open_peak in self._open_peaks]
+
+    @contextmanager
+    def stage(self, state, name):
+        """Time the enclosed block; set event['rows'] to record rows processed."""
+        event = {'rows': None}
+        if not self.path:
+            yield event
+            return
+        if self._open_peaks:
+            # Enclosing stages keep what they reached before this stage's reset
+            self._fold_peak_rss()
+        per_stage = self._reset_peak_rss()
+        if per_stage:
+            self._open_peaks.append(self._peak_rss_mb())
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield event
+        finally:
+            wall_s, cpu_s = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            if per_stage:
+                self._fold_peak_rss()
+                peak_rss_mb = self._open_peaks.pop()
+            else:
+                # Peak of the process so far (ru_maxrss is KiB on Linux)
+                peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        record = {
+            'run_id': self.run_id,
+            'state': state,
+            'stage': name,
+            'wall_s': wall_s,
+            'cpu_s': cpu_s,
+            'peak_rss_mb': peak_rss_mb,
+            'rss_scope': 'stage' if per_stage else 'process',
+            'rows': event['rows'],
+            'pid': os.getpid(),
+        }
+        # One short O_APPEND write per event keeps lines from different
+        # workers intact
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def events(self):
+        """Events recorded for this run."""
+        if not self.path or not os.path.exists(self.path):
+            return pd.DataFrame()
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return pd.DataFrame([r for r in records if r['run_id'] == self.run_id])
+
+    def print_summary(self, top=10):
+        """Print the slowest states and the time spent in each stage."""
+        events = self.events()
+        if events.empty:
+            return
+        print(f"\n--- Stage metrics (run {self.run_id}, events in {self.path}) ---")
+        by_stage = events.groupby('stage').agg(
+            wall_s=('wall_s', 'sum'), cpu_s=('cpu_s', 'sum'),
+            peak_rss_mb=('peak_rss_mb', 'max'), rows=('rows', 'sum'))
+        print(by_stage.sort_values('wall_s', ascending=False).round(2).to_string())
+        state_events = events[events['state'] != '']
+        if not state_events.empty:
+            by_state = state_events.groupby('state').agg(
+                wall_s=('wall_s', 'sum'), cpu_s=('cpu_s', 'sum'), peak_rss_mb=('peak_rss_mb', 'max'))
+            print(f"\nSlowest {top} states:")
+            print(by_state.sort_values('wall_s', ascending=False).head(top).round(2).to_string())
+
+
+NO_METRICS = StageMetrics()
+
+
+def count_rows(chunks, event):
+    """Pass chunks through, adding their lengths to event['rows']."""
+    event['rows'] = 0
+    for chunk in chunks:
+        event['rows'] += len(chunk)
+        yield chunk
+
+
+def dataset_path(state):
+    return f"hf://policyengine/policyengine-us-data/{state}.h5"
+
+
+def grouped_weighted_stats(groups, values, weights, sum_columns):
+    """Weighted medians, sums and counts for every group.
+
+    Sums and counts are one bincount each over the group index. Medians
+    are taken group by group, with an argsort and cumulative sum per group,
+    by weighted_stats.grouped_weighted_medians, which matches
+    MicroSeries.median exactly: the smallest value whose cumulative weight
+    share within its group reaches 0.5, ignoring rows with zero weight or
+    a missing value.
 
-def subset_microdf(mdf, condition):
-    """Subset a MicroDataFrame while preserving weights.
-    
     Args:
-        mdf: MicroDataFrame to subset
-        condition: Boolean array/Series for filtering
-    
+        groups: Integer group key per row (e.g. district geoid)
+        values: Values to take the weighted median of
+        weights: Row weights
+        sum_columns: Dict of name -> per-row values to weight and sum
+
     Returns:
-        MicroDataFrame with filtered rows and corresponding weights
+        Tuple of (unique group keys, medians, dict of weighted sums,
+        weighted counts), all aligned to the sorted group keys
     """
-    # Filter the data - .loc[] returns plain DataFrame
-    filtered_data = pd.DataFrame(mdf.loc[condition])
+    groups = np.asarray(groups)
+    weights = np.asarray(weights, dtype=float)
 
-    # Filter the weights using boolean values
-    filtered_weights = mdf.weights[condition.values]
+    keys, group_index = np.unique(groups, return_inverse=True)
+    sums = {
+        name: np.bincount(group_index, weights=np.asarray(col, dtype=float) * weights,
+                          minlength=len(keys))
+        for name, col in sum_columns.items()
+    }
+    counts = np.bincount(group_index, weights=weights, minlength=len(keys))
+    _, medians = grouped_weighted_medians(groups, values, weights)
 
-    # Create new MicroDataFrame
-    return mdf.__class__(filtered_data, weights=filtered_weights)
+    return keys, medians, sums, counts
 
 
-all_results = []
+def apply_schema(df, schema):
+    """Cast extract columns to the compact dtypes in schema.
 
-for state in states:
-    print(f"Processing {state}...")
-    sim = Microsimulation(dataset=f"hf://policyengine/policyengine-us-data/{state}.h5")
+    Args:
+        df: Extract with full-precision columns
+        schema: Dict of column -> dtype
 
-    household_df = sim.calculate_dataframe([
-        "household_id", "household_weight", "congressional_district_geoid",
-        "state_fips", "household_market_income", "snap"],
-        map_to="household")
+    Returns:
+        New DataFrame with only the schema's columns, in schema dtypes
 
-    person_df = sim.calculate_dataframe([
-        "person_id", "person_household_id", "age", "employment_income"],
-        map_to="person")
+    Raises:
+        ValueError: If an integer column doesn't fit its dtype
+    """
+    compact = {}
+    for column, dtype in schema.items():
+        values = np.asarray(df[column])
+        dtype = np.dtype(dtype)
+        if dtype.kind in 'iu' and len(values):
+            info = np.iinfo(dtype)
+            if values.min() < info.min or values.max() > info.max:
+                raise ValueError(f"{column} values don't fit in {dtype}")
+        compact[column] = values.astype(dtype)
+    return pd.DataFrame(compact)
 
-    hh_snap_data = household_df[['household_id', 'snap']].rename(
-        columns={'snap': 'hh_snap'}
-    )
 
-    person_df = person_df.merge(
-        hh_snap_data,
-        left_on='person_household_id',
-        right_on='household_id',
-        how='left'
-    )
+def extract_entities(sim, period=None):
+    """Household and person extracts of one simulation, with rows aligned.
 
-    person_df = person_df.drop(columns=['household_id'])
+    policyengine-core caches every variable a simulation computes, so the
+    dependencies the two levels share (snap's person-level inputs, say)
+    are evaluated once however the variables are requested; each variable
+    here is calculated once, at the level it is extracted at. Alongside
+    the variables, each person row gets HOUSEHOLD_ROW, the position of its
+    household in the household extract, projected from the simulation's
+    own membership so roll_up_persons needs no lookup by household id.
 
-    person_df['receiving_snap'] = (person_df['hh_snap'] > 0).astype(int)
-    person_df['snap_under_18'] = ((person_df['hh_snap'] > 0) & (person_df['age'] < 18)).astype(int)
-    person_df['snap_over_65'] = ((person_df['hh_snap'] > 0) & (person_df['age'] >= 65)).astype(int)
-    person_df['snap_employed'] = ((person_df['hh_snap'] > 0) & (person_df['employment_income'] > 0)).astype(int)
-    person_df['one'] = 1.0
+    Args:
+        sim: Microsimulation to calculate from
+        period: Period to calculate, or None for the simulation default
 
-    cols_to_sum = [
-        'one',
-        'receiving_snap',
-        'snap_under_18',
-        'snap_over_65',
-        'snap_employed'
-    ]
-    
-    hh_counts_df = person_df.groupby('person_household_id')[cols_to_sum].sum().reset_index()
-    hh_counts_df = hh_counts_df.rename(columns={
-        'one': 'sum_of_one',
-        'receiving_snap': 'n_snap_recipients',
-        'snap_under_18': 'n_snap_under_18',
-        'snap_over_65': 'n_snap_over_65',
-        'snap_employed': 'n_snap_employed'
-    })
+    Returns:
+        Tuple of (household_df, person_df) at full precision
+    """
+    household_df = pd.DataFrame(sim.calculate_dataframe(HOUSEHOLD_VARIABLES, period, map_to="household"))
+    person_df = pd.DataFrame(sim.calculate_dataframe(PERSON_VARIABLES, period, map_to="person"))
+    person_df[HOUSEHOLD_ROW] = np.asarray(sim.map_result(np.arange(len(household_df)), "household", "person"))
+    return household_df, person_df
 
-    household_df = household_df.merge(
-        hh_counts_df,
-        left_on='household_id',
-        right_on='person_household_id',
-        how='left'
-    )
-    household_df = household_df.drop(columns=['person_household_id'])
 
-    unweighted_counts = [
-        'n_snap_recipients',
-        'n_snap_under_18',
-        'n_snap_over_65',
-        'n_snap_employed'
+def extract_state(state, compact=True):
+    """Run the state's microsimulation and pull the columns we aggregate.
+
+    Args:
+        state: Two-letter state abbreviation
+        compact: Cast to HOUSEHOLD_SCHEMA/PERSON_SCHEMA dtypes
+
+    Returns:
+        Tuple of (household_df, person_df)
+    """
+    # Imported here so the aggregation stages can be used (and benchmarked)
+    # without the model installed
+    from policyengine_us import Microsimulation
+
+    sim = Microsimulation(dataset=dataset_path(state))
+
+    household_df, person_df = extract_entities(sim)
+
+    if compact:
+        household_df = apply_schema(household_df, HOUSEHOLD_SCHEMA)
+        person_df = apply_schema(person_df, PERSON_SCHEMA)
+
+    return household_df, person_df
+
+
+def check_dtype_tolerance(state):
+    """Check that compact extracts reproduce the full-precision result.
+
+    Args:
+        state: Two-letter state abbreviation
+
+    Raises:
+        ValueError: If any district column differs by more than DTYPE_RTOL
+    """
+    household_df, person_df = extract_state(state, compact=False)
+    expected = aggregate_state(household_df, person_df)
+    actual = aggregate_state(apply_schema(household_df, HOUSEHOLD_SCHEMA),
+                             apply_schema(person_df, PERSON_SCHEMA))
+
+    failed = [
+        column for column in expected.columns
+        if not np.allclose(actual[column].astype(float), expected[column].astype(float),
+                           rtol=DTYPE_RTOL, atol=0, equal_nan=True)
     ]
+    if failed:
+        raise ValueError(f"{state}: compact dtypes exceed rtol={DTYPE_RTOL} for {', '.join(failed)}")
+
+
+def extract_cache_key(state):
+    """Hash of everything that determines a state's extract."""
+    payload = json.dumps({
+        'dataset': dataset_path(state),
+        'policyengine_us': importlib.metadata.version('policyengine-us'),
+        'household_schema': HOUSEHOLD_SCHEMA,
+        'person_schema': PERSON_SCHEMA,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def iter_person_chunks(person_df, chunk_rows):
+    """Yield an in-memory person extract in slices of chunk_rows."""
+    for start in range(0, len(person_df), chunk_rows):
+        yield person_df.iloc[start:start + chunk_rows]
+
+
+def read_person_chunks(path, chunk_rows):
+    """Stream a cached person extract from Parquet in record batches."""
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+
+def cached_extract_state(state, cache_dir, chunk_rows=None):
+    """extract_state backed by Parquet files under cache_dir.
+
+    Extracts are keyed by dataset path, policyengine-us version and the
+    column schemas, so a model upgrade or a new variable misses the cache
+    while changes to the aggregation logic reuse it.
+
+    With chunk_rows, a fresh extract is written to the cache and dropped
+    before its person records are streamed back, so the roll-up reads the
+    same bounded batches on a cold run as on a warm one. The simulation
+    itself still holds the whole state while extract_state runs.
+
+    Args:
+        state: Two-letter state abbreviation
+        cache_dir: Directory holding cached extracts
+        chunk_rows: If given, return the person extract as an iterator of
+            chunks of at most this many rows instead of one frame
+
+    Returns:
+        Tuple of (household_df, person_df or person chunks)
+    """
+    state_dir = Path(cache_dir) / f"{state}-{extract_cache_key(state)}"
+    household_path = state_dir / 'household.parquet'
+    person_path = state_dir / 'person.parquet'
+
+    if household_path.exists() and person_path.exists():
+        if chunk_rows:
+            return pd.read_parquet(household_path), read_person_chunks(person_path, chunk_rows)
+        return pd.read_parquet(household_path), pd.read_parquet(person_path)
+
+    household_df, person_df = extract_state(state)
+
+    # Write under a temporary name first so parallel or interrupted runs
+    # never leave a partial file that looks like a hit
+    state_dir.mkdir(parents=True, exist_ok=True)
+    for df, path in [(person_df, person_path), (household_df, household_path)]:
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        df.to_parquet(tmp_path, index=False, row_group_size=PARQUET_ROW_GROUP_ROWS)
+        os.replace(tmp_path, path)
+
+    if chunk_rows:
+        del person_df
+        return household_df, read_person_chunks(person_path, chunk_rows)
+    return household_df, person_df
 
-    weighted_counts = [f'weighted_{col}' for col in unweighted_counts]
-    for i in range(len(unweighted_counts)):
-        unweighted_col = unweighted_counts[i]
-        weighted_col = weighted_counts[i]
-        household_df[weighted_col] = household_df[unweighted_col].values * household_df['household_weight'].values
 
+def household_index(household_ids):
+    """Sort order and sorted ids used to look up household positions."""
+    order = np.argsort(household_ids, kind='stable')
+    return order, household_ids[order]
+
+
+def household_positions(index, person_household_ids):
+    """Row position of each person's household, or -1 if it is missing.
+
+    Args:
+        index: (order, sorted_ids) from household_index
+        person_household_ids: person_household_id per person row
+
+    Returns:
+        Integer array aligned with person_household_ids
+    """
+    order, sorted_ids = index
+    if len(sorted_ids) == 0:
+        return np.full(len(person_household_ids), -1)
+    index = np.searchsorted(sorted_ids, person_household_ids)
+    index = np.minimum(index, len(sorted_ids) - 1)
+    found = sorted_ids[index] == person_household_ids
+    return np.where(found, order[index], -1)
+
+
+def roll_up_persons(household_df, person_df):
+    """Count each household's SNAP recipients, in total and by group.
+
+    Each person's household row comes from the extract's HOUSEHOLD_ROW
+    column, or, for person records without it, from a lookup by household
+    id built once. hh_snap is gathered per person with np.take and the
+    indicators are scattered back with np.bincount, so neither table is
+    merged or copied. person_df may also be an iterable of person chunks,
+    in which case counts are accumulated chunk by chunk and only one
+    chunk's temporaries are live at a time.
+
+    Args:
+        household_df: Household-level extract
+        person_df: Person-level extract, or an iterable of its chunks
+
+    Returns:
+        Dict of count arrays aligned with household_df rows
+    """
+    if isinstance(person_df, pd.DataFrame):
+        person_df = [person_df]
+
+    index = None
+    hh_snap = household_df['snap'].values
+    n_households = len(household_df)
+    counts = {name: np.zeros(n_households) for name in COUNT_COLUMNS}
+
+    for chunk in person_df:
+        if HOUSEHOLD_ROW in chunk.columns:
+            position = chunk[HOUSEHOLD_ROW].values
+        else:
+            if index is None:
+                index = household_index(household_df['household_id'].values)
+            position = household_positions(index, chunk['person_household_id'].values)
+        matched = position >= 0
+        position = position[matched]
+
+        receiving_snap = np.take(hh_snap, position) > 0
+        age = chunk['age'].values[matched]
+        employment_income = chunk['employment_income'].values[matched]
+
+        indicators = {
+            'n_snap_recipients': receiving_snap,
+            'n_snap_under_18': receiving_snap & (age < 18),
+            'n_snap_over_65': receiving_snap & (age >= 65),
+            'n_snap_employed': receiving_snap & (employment_income > 0),
+        }
+        for name, indicator in indicators.items():
+            counts[name] += np.bincount(position, weights=indicator, minlength=n_households)
+
+    return counts
+
+
+def district_totals(household_df, counts):
+    """Weighted SNAP recipient counts and household totals by district.
+
+    Args:
+        household_df: Household-level extract
+        counts: Per-household counts from roll_up_persons
+
+    Returns:
+        DataFrame with one row per (district, state)
+    """
+    # Weights may be stored as float32; accumulate in float64
+    weight = household_df['household_weight'].values.astype(float)
+
+    household_counts = pd.DataFrame({
+        'congressional_district_geoid': household_df['congressional_district_geoid'].values,
+        'state_fips': household_df['state_fips'].values,
+        'snap_population': counts['n_snap_recipients'] * weight,
+        'snap_under_18': counts['n_snap_under_18'] * weight,
+        'snap_over_65': counts['n_snap_over_65'] * weight,
+        'snap_employed': counts['n_snap_employed'] * weight,
+        'household_weight': weight,
+    })
     grouping_cols = ['congressional_district_geoid', 'state_fips']
-    cols_to_sum = weighted_counts + ['household_weight']
-    district_totals = household_df.groupby(grouping_cols)[cols_to_sum].sum().reset_index()
+    return household_counts.groupby(grouping_cols).sum().reset_index()
 
-    district_totals.rename(columns={
-        'weighted_n_snap_recipients': 'snap_population',
-        'weighted_n_snap_under_18': 'snap_under_18',
-        'weighted_n_snap_over_65': 'snap_over_65',
-        'weighted_n_snap_employed': 'snap_employed'
-    }, inplace=True)
 
+def district_snap_stats(household_df):
+    """Median income, benefits and weighted count of SNAP households by district.
+
+    Args:
+        household_df: Household-level extract
+
+    Returns:
+        DataFrame with one row per district that has SNAP households
+    """
     snap_households = household_df[household_df['snap'] > 0]
-    snap_households['one'] = 1
-
-    by_district_dfs = []
-    for cd_id in set(snap_households.congressional_district_geoid):
-        by_district_dfs.append(
-            pd.DataFrame({
-                'congressional_district_geoid': cd_id,
-                'state_fips': cd_id // 100,
-                'median_household_income': subset_microdf(snap_households, snap_households.congressional_district_geoid == cd_id).household_market_income.median(),
-                'total_weighted_snap': subset_microdf(snap_households, snap_households.congressional_district_geoid == cd_id).snap.sum(),
-                'one_sum_test': subset_microdf(snap_households, snap_households.congressional_district_geoid == cd_id).one.sum(),
-            }, index=[cd_id])
-        )
-    by_district = pd.concat(by_district_dfs)
-
-    combined = district_totals.merge(by_district, on=['congressional_district_geoid', 'state_fips'], how='left')
-    all_results.append(combined)
-
-combined_df = pd.concat(all_results, ignore_index=True)
-
-snap_estimate = np.sum(combined_df.total_weighted_snap)
-snap_target = 106744001279.0
 
-adj_factor = snap_target / snap_estimate
-
-combined_df['total_weighted_snap'] = adj_factor * combined_df['total_weighted_snap']
-
-combined_df['pct_under_18'] = (combined_df['snap_under_18'] / combined_df['snap_population'] * 100).round(1)
-combined_df['pct_over_65'] = (combined_df['snap_over_65'] / combined_df['snap_population'] * 100).round(1)
-combined_df['employment_rate'] = (combined_df['snap_employed'] / combined_df['snap_population'] * 100).round(1)
-
-combined_df = combined_df.sort_values(['state_fips', 'congressional_district_geoid'])
-combined_df.to_csv('snap_by_congressional_district.csv', index=False)
-print("--- Weighted SNAP Totals by Congressional District (All States) ---")
-print(combined_df.head(10))
-print(f"\nTotal districts: {len(combined_df)}")
-if 'one_sum_test' in combined_df.columns:
-    print(f"Test: Total 'one' sum (should be millions if weighted): {combined_df['one_sum_test'].sum():,.0f}")
-print(f"Total SNAP benefits: ${combined_df['total_weighted_snap'].sum():,.0f}")
-print(f"Total SNAP recipients: {combined_df['snap_population'].sum():,.0f}")
-print(f"Avg % under 18: {combined_df['pct_under_18'].mean():.1f}%")
-print(f"Avg % over 65: {combined_df['pct_over_65'].mean():.1f}%")
-print(f"Avg employment rate: {combined_df['employment_rate'].mean():.1f}%")
-print(f"Avg median household income: ${combined_df['median_household_income'].mean():,.0f}")
-print(f"\nDistricts with SNAP < $1000: {(combined_df['total_weighted_snap'] < 1000).sum()}")
+    cd_ids, medians, sums, counts = grouped_weighted_stats(
+        snap_households['congressional_district_geoid'].values,
+        snap_households['household_market_income'].values,
+        snap_households['household_weight'].values,
+        {'total_weighted_snap': snap_households['snap'].values}
+    )
+    return pd.DataFrame({
+        'congressional_district_geoid': cd_ids,
+        'state_fips': cd_ids // 100,
+        'median_household_income': medians,
+        'total_weighted_snap': sums['total_weighted_snap'],
+        'one_sum_test': counts,
+    })
+
+
+def roll_up_state(household_df, person_df, metrics=NO_METRICS, state=''):
+    """roll_up_persons, recorded as the person_rollup stage."""
+    with metrics.stage(state, 'person_rollup') as event:
+        if isinstance(person_df, pd.DataFrame):
+            event['rows'] = len(person_df)
+        else:
+            person_df = count_rows(person_df, event)
+        return roll_up_persons(household_df, person_df)
+
+
+def aggregate_districts(household_df, counts, metrics=NO_METRICS, state='', replicates=0,
+                        calibration=None):
+    """District totals and SNAP household statistics from household records.
+
+    Args:
+        household_df: Household-level extract (one or more states)
+        counts: Per-household counts from roll_up_persons
+        metrics: StageMetrics to record each stage in
+        state: State label for the metrics events
+        replicates: Number of bootstrap replicates for <column>_se
+            standard error columns, or 0 for none
+        calibration: (matrix, totals) the weights were raked to, if any,
+            so the replicates are raked to them too
+
+    Returns:
+        DataFrame with one uncalibrated row per congressional district
+    """
+    with metrics.stage(state, 'district_totals') as event:
+        event['rows'] = len(household_df)
+        totals = district_totals(household_df, counts)
+    with metrics.stage(state, 'weighted_median') as event:
+        event['rows'] = len(household_df)
+        by_district = district_snap_stats(household_df)
+    combined = totals.merge(by_district, on=['congressional_district_geoid', 'state_fips'], how='left')
+    if replicates:
+        with metrics.stage(state, 'standard_errors') as event:
+            event['rows'] = len(household_df)
+            standard_errors = district_standard_errors(household_df, counts, replicates,
+                                                       calibration=calibration)
+        combined = combined.merge(standard_errors, on=['congressional_district_geoid', 'state_fips'],
+                                  how='left')
+    return combined
+
+
+def aggregate_state(household_df, person_df, metrics=NO_METRICS, state='', replicates=0):
+    """Aggregate one state's households and people to district totals.
+
+    Args:
+        household_df: Household-level extract from extract_state
+        person_df: Person-level extract from extract_state, or an
+            iterable of its chunks
+        metrics: StageMetrics to record each stage in
+        state: State label for the metrics events
+        replicates: Number of bootstrap replicates, or 0 for no standard errors
+
+    Returns:
+        DataFrame with one uncalibrated row per congressional district
+    """
+    counts = roll_up_state(household_df, person_df, metrics, state)
+    return aggregate_districts(household_df, counts, metrics, state, replicates)
+
+
+def load_state(state, cache_dir=None, chunk_rows=None, metrics=NO_METRICS):
+    """Extract a state, from the cache if given, as the extraction stage.
+
+    Args:
+        state: Two-letter state abbreviation
+        cache_dir: Extract cache directory, or None to always simulate
+        chunk_rows: Person rows per roll-up chunk, or None for one pass
+        metrics: StageMetrics to record the stage in
+
+    Returns:
+        Tuple of (household_df, person_df or person chunks)
+    """
+    print(f"Processing {state}...")
+    with metrics.stage(state, 'extraction') as event:
+        if cache_dir:
+            household_df, person_df = cached_extract_state(state, cache_dir, chunk_rows)
+        else:
+            household_df, person_df = extract_state(state)
+            if chunk_rows:
+                person_df = iter_person_chunks(person_df, chunk_rows)
+        event['rows'] = len(household_df)
+    return household_df, person_df
+
+
+def process_state(state, cache_dir=None, chunk_rows=None, metrics=NO_METRICS, replicates=0):
+    """Extract and aggregate a single state.
+
+    Args:
+        state: Two-letter state abbreviation
+        cache_dir: Extract cache directory, or None to always simulate
+        chunk_rows: Person rows per roll-up chunk, or None for one pass
+        metrics: StageMetrics to record each stage in
+        replicates: Number of bootstrap replicates, or 0 for no standard errors
+
+    Returns:
+        DataFrame with one uncalibrated row per congressional district
+    """
+    household_df, person_df = load_state(state, cache_dir, chunk_rows, metrics)
+    return aggregate_state(household_df, person_df, metrics, state, replicates)
+
+
+def state_households(state, cache_dir=None, chunk_rows=None, metrics=NO_METRICS):
+    """Extract a state and roll its persons up to one record per household.
+
+    Args:
+        state: Two-letter state abbreviation
+        cache_dir: Extract cache directory, or None to always simulate
+        chunk_rows: Person rows per roll-up chunk, or None for one pass
+        metrics: StageMetrics to record each stage in
+
+    Returns:
+        household_df with the roll_up_persons counts as extra columns
+    """
+    household_df, person_df = load_state(state, cache_dir, chunk_rows, metrics)
+    counts = roll_up_state(household_df, person_df, metrics, state)
+    return household_df.assign(**counts)
+
+
+def rake_households(households, targets, metrics=NO_METRICS, replicates=0):
+    """Aggregate all states with household weights raked to the targets.
+
+    Args:
+        households: state_households records for every state
+        targets: Dict from calibration.load_targets; the national
+            snap_benefits target defaults to snap_target
+        metrics: StageMetrics to record each stage in
+        replicates: Number of bootstrap replicates, each raked to the
+            same targets, or 0 for no standard errors
+
+    Returns:
+        DataFrame with one row per district, on the calibrated weights
+    """
+    targets = {**targets, 'national': {'snap_benefits': snap_target, **targets.get('national', {})}}
+    with metrics.stage('', 'raking') as event:
+        event['rows'] = len(households)
+        matrix, totals, labels = target_matrix(households, targets, state_fips_codes)
+        households['household_weight'] = rake_weights(
+            matrix, totals, households['household_weight'].values)
+    print(f"Raked household weights to {len(labels)} targets")
+    counts = {name: households[name].values for name in COUNT_COLUMNS}
+    return aggregate_districts(households, counts, metrics, '', replicates, (matrix, totals))
+
+
+def raked_weight_basis(targets):
+    """weight_basis label of a table raked to targets: a hash of the targets."""
+    payload = json.dumps({'snap_target': snap_target, 'targets': targets}, sort_keys=True)
+    return f"raked-{hashlib.sha256(payload.encode()).hexdigest()[:12]}"
+
+
+def calibration_factor(combined_df):
+    """Ratio of snap_target to the table's uncalibrated benefit total."""
+    # Sum in output order so a spliced table calibrates exactly like a full run
+    combined_df = combined_df.sort_values(['state_fips', 'congressional_district_geoid'])
+    snap_estimate = np.sum(combined_df.total_weighted_snap)
+    return snap_target / snap_estimate
+
+
+def calibrated_columns(combined_df):
+    """CALIBRATED_COLUMNS and their standard errors present in a table."""
+    return [column for name in CALIBRATED_COLUMNS for column in (name, f'{name}_se')
+            if column in combined_df.columns]
+
+
+def calibrate(combined_df, adj_factor=None, weight_basis=SURVEY_WEIGHTS):
+    """Scale benefits to the national target and add percentage columns.
+
+    The pre-scaling benefit total is kept per row in
+    uncalibrated_weighted_snap so individual states can later be
+    recomputed and the table recalibrated (see splice_states), and the
+    weights the rows were aggregated on are recorded in weight_basis.
+    Standard error columns, if any, follow them, each in CALIBRATED_COLUMNS
+    scaled by the same factor as its estimate.
+
+    Args:
+        combined_df: Uncalibrated district rows for all states
+        adj_factor: Scaling to apply instead of the table's own
+            calibration_factor, e.g. the baseline's factor for a reform
+        weight_basis: SURVEY_WEIGHTS, or raked_weight_basis(targets) for
+            rows aggregated on raked weights
+
+    Returns:
+        Calibrated district table sorted by state and district
+    """
+    combined_df = combined_df.sort_values(['state_fips', 'congressional_district_geoid'])
+    if adj_factor is None:
+        adj_factor = calibration_factor(combined_df)
+
+    uncalibrated_weighted_snap = combined_df['total_weighted_snap']
+    for column in calibrated_columns(combined_df):
+        combined_df[column] = adj_factor * combined_df[column]
+
+    combined_df['pct_under_18'] = (combined_df['snap_under_18'] / combined_df['snap_population'] * 100).round(1)
+    combined_df['pct_over_65'] = (combined_df['snap_over_65'] / combined_df['snap_population'] * 100).round(1)
+    combined_df['employment_rate'] = (combined_df['snap_employed'] / combined_df['snap_population'] * 100).round(1)
+
+    # Appended last so the existing column positions don't move
+    combined_df['uncalibrated_weighted_snap'] = uncalibrated_weighted_snap
+    combined_df['weight_basis'] = weight_basis
+    se_columns = [column for column in combined_df.columns if column.endswith('_se')]
+    combined_df = combined_df[[column for column in combined_df.columns if column not in se_columns]
+                              + se_columns]
+
+    return combined_df
+
+
+def splice_states(existing_df, state_results, weight_basis=SURVEY_WEIGHTS):
+    """Replace some states' rows in a calibrated table and recalibrate.
+
+    Args:
+        existing_df: Previously written district table
+        state_results: Uncalibrated frames from process_state
+        weight_basis: Weights the new rows were aggregated on; the table
+            must have been built on the same weights
+
+    Returns:
+        Calibrated district table covering all states
+
+    Raises:
+        ValueError: As splice_rows
+    """
+    return calibrate(splice_rows(existing_df, state_results, weight_basis), weight_basis=weight_basis)
+
+
+def check_splice_table(existing_df, weight_basis=SURVEY_WEIGHTS):
+    """Check that states aggregated on weight_basis can be spliced into a table.
+
+    Raises:
+        ValueError: If the table has no uncalibrated_weighted_snap or
+            weight_basis column, or was built on other weights
+    """
+    if not {'uncalibrated_weighted_snap', 'weight_basis'} <= set(existing_df.columns):
+        raise ValueError(
+            f"{output_path} has no uncalibrated_weighted_snap or weight_basis column; "
+            "run a full build once before recomputing individual states")
+    existing_basis = sorted(existing_df['weight_basis'].unique())
+    if existing_basis != [weight_basis]:
+        raise ValueError(
+            f"{output_path} was built on {', '.join(existing_basis)} weights, not {weight_basis}; "
+            "states recomputed on other weights can't be spliced into it "
+            "(raked tables are rebuilt in full with --targets)")
+
+
+def splice_rows(existing_df, state_results, weight_basis=SURVEY_WEIGHTS):
+    """Uncalibrated rows of a table with some states replaced.
+
+    The kept states' rows have the table's calibration undone, so the
+    result can be calibrated like the output of a full run.
+
+    Args:
+        existing_df: Previously written district table
+        state_results: Uncalibrated frames from process_state
+        weight_basis: Weights the new rows were aggregated on; the table
+            must have been built on the same weights
+
+    Returns:
+        Uncalibrated district rows covering all states
+
+    Raises:
+        ValueError: If the table can't be recalibrated, or was built on
+            different weights (e.g. raked to targets) than the new rows
+    """
+    check_splice_table(existing_df, weight_basis)
+
+    new_df = pd.concat(state_results, ignore_index=True)
+    existing_se = {column for column in existing_df.columns if column.endswith('_se')}
+    new_se = {column for column in new_df.columns if column.endswith('_se')}
+    if existing_se != new_se:
+        raise ValueError(
+            f"{output_path} {'has' if existing_se else 'has no'} standard error columns; "
+            f"recompute states {'with' if existing_se else 'without'} --replicates to match")
+
+    # Undo the previous calibration factor on every column it scaled: the
+    # factor calibrate derived from the same uncalibrated totals
+    previous_factor = calibration_factor(
+        existing_df.assign(total_weighted_snap=existing_df['uncalibrated_weighted_snap']))
+    kept_df = existing_df[~existing_df['state_fips'].isin(new_df['state_fips'])].copy()
+    for column in calibrated_columns(kept_df):
+        kept_df[column] = kept_df[column] / previous_factor
+    kept_df['total_weighted_snap'] = kept_df['uncalibrated_weighted_snap']
+    kept_df = kept_df[new_df.columns]
+
+    return pd.concat([kept_df, new_df], ignore_index=True)
+
+
+def print_summary(combined_df):
+    """Print national totals and averages for a calibrated district table."""
+    print("--- Weighted SNAP Totals by Congressional District (All States) ---")
+    print(combined_df.head(10))
+    print(f"\nTotal districts: {len(combined_df)}")
+    if 'one_sum_test' in combined_df.columns:
+        print(f"Test: Total 'one' sum (should be millions if weighted): {combined_df['one_sum_test'].sum():,.0f}")
+    print(f"Total SNAP benefits: ${combined_df['total_weighted_snap'].sum():,.0f}")
+    print(f"Total SNAP recipients: {combined_df['snap_population'].sum():,.0f}")
+    print(f"Avg % under 18: {combined_df['pct_under_18'].mean():.1f}%")
+    print(f"Avg % over 65: {combined_df['pct_over_65'].mean():.1f}%")
+    print(f"Avg employment rate: {combined_df['employment_rate'].mean():.1f}%")
+    print(f"Avg median household income: ${combined_df['median_household_income'].mean():,.0f}")
+    print(f"\nDistricts with SNAP < $1000: {(combined_df['total_weighted_snap'] < 1000).sum()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SNAP totals by congressional district")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of states to process in parallel (default: 1)")
+    parser.add_argument('--cache-dir', default='.snap_cache',
+                        help="Directory for cached simulation extracts (default: .snap_cache)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Always rerun the simulations and don't write extracts")
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                        help="Stream person records through the roll-up from the extract "
+                             "cache in chunks sized to stay within this many megabytes per "
+                             "state (with --no-cache, only the roll-up's temporaries are chunked)")
+    parser.add_argument('--check-dtypes', action='store_true',
+                        help="Before the run, check each state's compact extract against "
+                             "a full-precision aggregation")
+    parser.add_argument('--metrics', metavar='PATH', default=os.environ.get(METRICS_ENV),
+                        help="Append per-state, per-stage timing and memory events to this "
+                             f"JSON-lines file and print a summary (also set by ${METRICS_ENV})")
+    parser.add_argument('--targets', metavar='PATH',
+                        help="JSON file of national/state targets (benefits, recipients, "
+                             "households) to rake household weights to before aggregating")
+    parser.add_argument('--replicates', type=int, default=0, metavar='R',
+                        help="Add a bootstrap standard error column for every district "
+                             "column, from R Poisson replicate weights (e.g. 200); needs "
+                             "about R bytes per household, plus R x 8 bytes per household "
+                             "of the largest state several times over")
+    parser.add_argument('--states',
+                        help="Comma-separated states (e.g. CA,NY) to recompute and splice "
+                             "into the existing output instead of rebuilding every state")
+    args = parser.parse_args()
+
+    if args.states:
+        run_states = [state.strip().upper() for state in args.states.split(',')]
+        unknown = sorted(set(run_states) - set(states))
+        if unknown:
+            parser.error(f"unknown states: {', '.join(unknown)}")
+    else:
+        run_states = states
+    if args.states and args.targets:
+        parser.error("--targets recalibrates every state and can't be combined with --states")
+    targets = load_targets(args.targets) if args.targets else None
+    if args.states:
+        # Checked before any state runs, so a table that can't take the
+        # recomputed states is reported up front
+        if not os.path.exists(output_path):
+            parser.error(f"--states splices into {output_path}, which doesn't exist; "
+                         "run a full build first")
+        existing_df = pd.read_csv(output_path, float_precision='round_trip')
+        try:
+            check_splice_table(existing_df)
+        except ValueError as error:
+            parser.error(str(error))
+        existing_se = any(column.endswith('_se') for column in existing_df.columns)
+        if existing_se != bool(args.replicates):
+            parser.error(f"{output_path} {'has' if existing_se else 'has no'} standard error columns; "
+                         f"recompute states {'with' if existing_se else 'without'} --replicates to match")
+
+    if args.check_dtypes:
+        for state in run_states:
+            check_dtype_tolerance(state)
+        print(f"Compact dtypes within rtol={DTYPE_RTOL} for {len(run_states)} states")
+
+    chunk_rows = None
+    if args.memory_budget:
+        chunk_rows = max(1, args.memory_budget * 2**20 // PERSON_ROW_BYTES)
+
+    metrics = StageMetrics(args.metrics)
+    # With targets, workers return household records so weights can be
+    # raked nationally before anything is aggregated
+    run_state = partial(state_households if targets else process_state,
+                        cache_dir=None if args.no_cache else args.cache_dir,
+                        chunk_rows=chunk_rows,
+                        metrics=metrics)
+    if not targets:
+        # With targets, standard errors are computed after raking instead
+        run_state = partial(run_state, replicates=args.replicates)
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            all_results = list(executor.map(run_state, run_states))
+    else:
+        all_results = [run_state(state) for state in run_states]
+
+    with metrics.stage('', 'calibration') as event:
+        weight_basis = SURVEY_WEIGHTS
+        if targets:
+            uncalibrated_df = rake_households(pd.concat(all_results, ignore_index=True), targets, metrics,
+                                              args.replicates)
+            weight_basis = raked_weight_basis(targets)
+            # Benefits already meet their target through the weights
+            adj_factor = 1.0
+        else:
+            if args.states:
+                uncalibrated_df = splice_rows(existing_df, all_results)
+            else:
+                uncalibrated_df = pd.concat(all_results, ignore_index=True)
+            adj_factor = calibration_factor(uncalibrated_df)
+        # The factor is recorded in the dataset metadata as applied here
+        combined_df = calibrate(uncalibrated_df, adj_factor, weight_basis)
+        event['rows'] = len(combined_df)
+    with metrics.stage('', 'csv_write') as event:
+        combined_df.to_csv(output_path, index=False)
+        event['rows'] = len(combined_df)
+    with metrics.stage('', 'dataset_write') as event:
+        write_district_dataset(
+            combined_df, 'baseline', 'default',
+            calibration_factor=adj_factor,
+            source_dataset=dataset_path('{state}'))
+        event['rows'] = len(combined_df)
+    print_summary(combined_df)
+    metrics.print_summary()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Run the SNAP district aggregation for several reforms and periods at once.
+
+Each state's dataset is loaded once. For every period, the columns a SNAP
+reform can't change (ids, weights, districts, market and employment
+income, age) are extracted once from the baseline simulation and shared
+by every scenario; a reform scenario only recalculates snap. Reform
+benefits are scaled with the baseline calibration factor for the same
+period, so scenarios stay comparable.
+
+The scenarios file is a JSON list such as:
+
+    [
+        {"name": "gross_limit_150", "period": 2025,
+         "reform": {"gov.usda.snap.income.limit.gross": {"2025-01-01.2100-12-31": 1.5}}},
+        {"name": "gross_limit_200", "period": 2025,
+         "reform": {"gov.usda.snap.income.limit.gross": {"2025-01-01.2100-12-31": 2.0}}}
+    ]
+
+Every period also gets a "baseline" scenario with no reform.
+
+Example:
+    python snap_scenarios.py scenarios.json --workers 16
+"""
+
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+import snap_districts
+from district_dataset import write_district_dataset
+
+
+BASELINE = 'baseline'
+output_path = 'snap_scenarios_by_congressional_district.csv'
+
+
+def load_scenarios(path):
+    """Read and validate a scenarios file.
+
+    Args:
+        path: JSON file with a list of {"name", "period", "reform"} objects
+
+    Returns:
+        List of scenario dicts, with a baseline scenario added per period
+
+    Raises:
+        ValueError: If names are missing, repeated or reserved
+    """
+    with open(path) as f:
+        scenarios = json.load(f)
+
+    names = [scenario.get('name') for scenario in scenarios]
+    if None in names or len(set(names)) != len(names):
+        raise ValueError("every scenario needs a unique name")
+    if BASELINE in names:
+        raise ValueError(f"'{BASELINE}' is added automatically for each period")
+
+    periods = []
+    for scenario in scenarios:
+        if scenario.get('reform') is None:
+            raise ValueError(f"scenario {scenario['name']} has no reform")
+        if scenario.get('period') not in periods:
+            periods.append(scenario.get('period'))
+
+    baselines = [{'name': BASELINE, 'period': period, 'reform': None} for period in periods]
+    return baselines + scenarios
+
+
+def build_reform(parameter_changes):
+    """Reform object from a {parameter: {period: value}} dict."""
+    from policyengine_core.reforms import Reform
+
+    return Reform.from_dict(parameter_changes, country_id='us')
+
+
+def run_state_scenarios(state, scenarios):
+    """Aggregate every scenario for one state from a single dataset load.
+
+    Args:
+        state: Two-letter state abbreviation
+        scenarios: Scenario dicts from load_scenarios
+
+    Returns:
+        Long DataFrame of uncalibrated district rows with scenario and
+        period columns
+    """
+    from policyengine_us import Microsimulation
+
+    print(f"Processing {state}...")
+    baseline = Microsimulation(dataset=snap_districts.dataset_path(state))
+    # Reform simulations reuse the baseline's already-resolved dataset
+    dataset = baseline.dataset
+
+    periods = []
+    for scenario in scenarios:
+        if scenario['period'] not in periods:
+            periods.append(scenario['period'])
+
+    results = []
+    for period in periods:
+        household_df, person_df = snap_districts.extract_entities(baseline, period)
+        household_df = snap_districts.apply_schema(household_df, snap_districts.HOUSEHOLD_SCHEMA)
+        person_df = snap_districts.apply_schema(person_df, snap_districts.PERSON_SCHEMA)
+
+        for scenario in scenarios:
+            if scenario['period'] != period:
+                continue
+            scenario_df = household_df
+            if scenario['reform'] is not None:
+                reformed = Microsimulation(dataset=dataset, reform=build_reform(scenario['reform']))
+                snap = np.asarray(reformed.calculate('snap', period, map_to='household'))
+                scenario_df = household_df.assign(snap=snap.astype(snap_districts.HOUSEHOLD_SCHEMA['snap']))
+
+            district_df = snap_districts.aggregate_state(scenario_df, person_df)
+            district_df.insert(0, 'period', period)
+            district_df.insert(0, 'scenario', scenario['name'])
+            results.append(district_df)
+
+    return pd.concat(results, ignore_index=True)
+
+
+def calibrate_scenarios(long_df, scenarios):
+    """Calibrate every scenario with its period's baseline factor.
+
+    Args:
+        long_df: Uncalibrated rows for all states and scenarios
+        scenarios: Scenario dicts from load_scenarios
+
+    Returns:
+        Tuple of (calibrated long table ordered by scenario, then state and
+        district; dict of period -> calibration factor)
+    """
+    calibrated = []
+    factors = {}
+    for scenario in scenarios:
+        rows = long_df[(long_df['scenario'] == scenario['name'])
+                       & (long_df['period'] == scenario['period'])]
+        if scenario['name'] == BASELINE:
+            factors[scenario['period']] = snap_districts.calibration_factor(rows)
+        calibrated.append(snap_districts.calibrate(rows, factors[scenario['period']]))
+    return pd.concat(calibrated, ignore_index=True), factors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SNAP district totals for several reforms and periods")
+    parser.add_argument('scenarios', help="JSON file listing {name, period, reform} scenarios")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of states to process in parallel (default: 1)")
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.scenarios)
+
+    run_state = partial(run_state_scenarios, scenarios=scenarios)
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            all_results = list(executor.map(run_state, snap_districts.states))
+    else:
+        all_results = [run_state(state) for state in snap_districts.states]
+
+    long_df, factors = calibrate_scenarios(pd.concat(all_results, ignore_index=True), scenarios)
+    long_df.to_csv(output_path, index=False)
+
+    for (name, period), rows in long_df.groupby(['scenario', 'period'], sort=False):
+        write_district_dataset(
+            rows.drop(columns=['scenario', 'period']), name, period,
+            calibration_factor=factors[period],
+            source_dataset=snap_districts.dataset_path('{state}'))
+
+    print(f"\n--- SNAP benefits by scenario ({output_path}) ---")
+    print(long_df.groupby(['scenario', 'period'], sort=False)[
+        ['total_weighted_snap', 'snap_population']].sum().to_string())
+
+
+if __name__ == '__main__':
+    main()
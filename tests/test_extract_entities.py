@@ -0,0 +1,20 @@
+import numpy as np
+
+import snap_districts
+from benchmark_snap_districts import SyntheticMicrosimulation
+
+
+def test_household_rows_match_the_household_id_lookup():
+    sim = SyntheticMicrosimulation(5000, 4, seed=3)
+    household_df, person_df = snap_districts.extract_entities(sim)
+    # Shuffled ids, so row positions and ids differ
+    shuffled = np.random.default_rng(0).permutation(len(household_df))
+    household_df = household_df.assign(household_id=shuffled)
+    person_df = person_df.assign(person_household_id=shuffled[person_df['person_household_id']])
+
+    by_row = snap_districts.roll_up_persons(household_df, person_df)
+    by_id = snap_districts.roll_up_persons(household_df, person_df.drop(columns=snap_districts.HOUSEHOLD_ROW))
+
+    for name in snap_districts.COUNT_COLUMNS:
+        np.testing.assert_array_equal(by_row[name], by_id[name])
+    assert by_row['n_snap_recipients'].sum() > 0
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import snap_districts
+
+
+def synthetic_state(state_fips, seed, n_households=400, n_districts=3):
+    """Household and person extracts for one state."""
+    rng = np.random.default_rng(seed)
+    household_df = pd.DataFrame({
+        'household_id': np.arange(n_households),
+        'household_weight': rng.uniform(50, 500, n_households),
+        'congressional_district_geoid': state_fips * 100 + rng.integers(1, n_districts + 1, n_households),
+        'state_fips': state_fips,
+        'household_market_income': rng.lognormal(10, 1, n_households),
+        'snap': np.where(rng.random(n_households) < 0.3, rng.uniform(500, 9000, n_households), 0.0),
+    })
+    n_persons = 3 * n_households
+    person_df = pd.DataFrame({
+        'person_id': np.arange(n_persons),
+        'person_household_id': rng.integers(0, n_households, n_persons),
+        'age': rng.integers(0, 90, n_persons),
+        'employment_income': np.where(rng.random(n_persons) < 0.5, 20000.0, 0.0),
+    })
+    return household_df, person_df
+
+
+STATES = {'CA': 6, 'TX': 48}
+EXTRACTS = {state: synthetic_state(fips, seed) for seed, (state, fips) in enumerate(STATES.items())}
+
+
+def survey_table():
+    return snap_districts.calibrate(pd.concat(
+        [snap_districts.aggregate_state(*EXTRACTS[state]) for state in STATES], ignore_index=True))
+
+
+def raked_table(targets):
+    households = pd.concat([
+        household_df.assign(**snap_districts.roll_up_persons(household_df, person_df))
+        for household_df, person_df in EXTRACTS.values()
+    ], ignore_index=True)
+    raked_df = snap_districts.rake_households(households, targets)
+    return snap_districts.calibrate(raked_df, adj_factor=1.0,
+                                    weight_basis=snap_districts.raked_weight_basis(targets))
+
+
+def round_trip(df, tmp_path):
+    path = tmp_path / 'districts.csv'
+    df.to_csv(path, index=False)
+    return pd.read_csv(path, float_precision='round_trip')
+
+
+def test_survey_splice_matches_full_build(tmp_path):
+    existing_df = round_trip(survey_table(), tmp_path)
+
+    spliced = snap_districts.splice_states(existing_df, [snap_districts.aggregate_state(*EXTRACTS['TX'])])
+
+    pd.testing.assert_frame_equal(spliced.reset_index(drop=True), existing_df, check_exact=False, rtol=1e-12)
+
+
+def test_splice_refuses_raked_table(tmp_path):
+    survey_df = survey_table()
+    recipients = survey_df.groupby('state_fips')['snap_population'].sum()
+    targets = {
+        # In place of the national snap_target, which is far above two synthetic states
+        'national': {'snap_benefits': 1.1 * survey_df['uncalibrated_weighted_snap'].sum()},
+        'states': {'TX': {'snap_recipients': 1.2 * recipients[48]},
+                   'CA': {'snap_recipients': 0.9 * recipients[6]}},
+    }
+    existing_df = round_trip(raked_table(targets), tmp_path)
+    assert (existing_df['weight_basis'] == snap_districts.raked_weight_basis(targets)).all()
+
+    with pytest.raises(ValueError, match='raked-'):
+        snap_districts.splice_states(existing_df, [snap_districts.aggregate_state(*EXTRACTS['TX'])])
+
+
+def test_raked_weight_basis_follows_targets():
+    basis = snap_districts.raked_weight_basis({'national': {'snap_recipients': 4e7}})
+
+    assert basis != snap_districts.raked_weight_basis({'national': {'snap_recipients': 4.1e7}})
+    assert basis == snap_districts.raked_weight_basis({'national': {'snap_recipients': 4e7}})
+    assert basis != snap_districts.SURVEY_WEIGHTS
+
+
+def test_splice_refuses_table_without_weight_basis(tmp_path):
+    existing_df = round_trip(survey_table().drop(columns='weight_basis'), tmp_path)
+
+    with pytest.raises(ValueError, match='weight_basis'):
+        snap_districts.splice_states(existing_df, [snap_districts.aggregate_state(*EXTRACTS['TX'])])
+
+
+def test_splice_rescales_standard_errors_with_their_estimates(tmp_path):
+    # A kept district with no SNAP households, whose benefit total and
+    # standard error are both zero
+    household_df, person_df = EXTRACTS['CA']
+    household_df = household_df.assign(snap=household_df['snap'].where(
+        household_df['congressional_district_geoid'] != 601, 0.0))
+    extracts = {'CA': (household_df, person_df), 'TX': EXTRACTS['TX']}
+    full_df = snap_districts.calibrate(pd.concat(
+        [snap_districts.aggregate_state(*extracts[state], replicates=20) for state in STATES],
+        ignore_index=True))
+    existing_df = round_trip(full_df, tmp_path)
+
+    spliced = snap_districts.splice_states(
+        existing_df, [snap_districts.aggregate_state(*extracts['TX'], replicates=20)])
+
+    assert spliced['total_weighted_snap_se'].notna().all()
+    pd.testing.assert_frame_equal(spliced.reset_index(drop=True), existing_df, check_exact=False, rtol=1e-12)
+
+
+def test_states_run_reports_raked_table_as_usage_error(tmp_path, monkeypatch, capsys):
+    path = tmp_path / 'districts.csv'
+    survey_table().assign(weight_basis='raked-0123456789ab').to_csv(path, index=False)
+    monkeypatch.setattr(snap_districts, 'output_path', str(path))
+    monkeypatch.setattr('sys.argv', ['snap_districts.py', '--states', 'TX'])
+
+    with pytest.raises(SystemExit) as exit_info:
+        snap_districts.main()
+
+    assert exit_info.value.code == 2
+    assert 'raked-0123456789ab' in capsys.readouterr().err
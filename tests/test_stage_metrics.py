@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import snap_districts
+
+
+pytestmark = pytest.mark.skipif(not snap_districts.StageMetrics._reset_peak_rss(),
+                                reason="RSS high-water mark can't be reset here")
+
+
+def allocate(megabytes):
+    """Touch and release megabytes of memory."""
+    block = np.ones(megabytes * 2**20 // 8)
+    return float(block[-1])
+
+
+def test_peak_rss_is_per_stage(tmp_path):
+    metrics = snap_districts.StageMetrics(str(tmp_path / 'metrics.jsonl'))
+
+    with metrics.stage('CA', 'extraction'):
+        allocate(200)
+    with metrics.stage('TX', 'extraction'):
+        allocate(10)
+
+    peaks = metrics.events().set_index('state')['peak_rss_mb']
+    assert (metrics.events()['rss_scope'] == 'stage').all()
+    assert peaks['CA'] - peaks['TX'] > 150
+
+
+def test_enclosing_stage_keeps_inner_peaks(tmp_path):
+    metrics = snap_districts.StageMetrics(str(tmp_path / 'metrics.jsonl'))
+
+    with metrics.stage('', 'calibration'):
+        with metrics.stage('', 'raking'):
+            allocate(200)
+        with metrics.stage('', 'standard_errors'):
+            allocate(10)
+
+    peaks = metrics.events().set_index('stage')['peak_rss_mb']
+    assert peaks['calibration'] >= peaks['raking'] > peaks['standard_errors'] + 150
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+import snap_districts
+from calibration import rake_replicates, rake_weights, target_matrix
+from uncertainty import district_standard_errors, replicate_multipliers, state_standard_errors
+
+
+def synthetic_households(seed=0, n_households=600):
+    """Household records for two single-district states, with person counts."""
+    rng = np.random.default_rng(seed)
+    state_fips = np.where(np.arange(n_households) < n_households // 2, 6, 48)
+    snap = np.where(rng.random(n_households) < 0.4, rng.uniform(500, 9000, n_households), 0.0)
+    recipients = np.where(snap > 0, rng.integers(1, 6, n_households), 0)
+    return pd.DataFrame({
+        'household_weight': rng.uniform(50, 500, n_households),
+        'congressional_district_geoid': state_fips * 100 + 1,
+        'state_fips': state_fips,
+        'household_market_income': rng.lognormal(10, 1, n_households),
+        'snap': snap,
+        'n_snap_recipients': recipients,
+        'n_snap_under_18': rng.binomial(recipients, 0.4),
+        'n_snap_over_65': rng.binomial(recipients, 0.1),
+        'n_snap_employed': rng.binomial(recipients, 0.3),
+    })
+
+
+def raked(households):
+    """Households raked to state recipient targets, and the targets' matrix."""
+    weighted = households['household_weight'] * households['n_snap_recipients']
+    recipients = weighted.groupby(households['state_fips']).sum()
+    targets = {'states': {'CA': {'snap_recipients': 1.2 * recipients[6]},
+                          'TX': {'snap_recipients': 0.9 * recipients[48]}}}
+    matrix, totals, _ = target_matrix(households, targets, snap_districts.state_fips_codes)
+    households = households.assign(household_weight=rake_weights(
+        matrix, totals, households['household_weight'].values))
+    return households, (matrix, totals)
+
+
+def counts_of(households):
+    return {name: households[name].values for name in snap_districts.COUNT_COLUMNS}
+
+
+def test_rake_replicates_meets_every_target():
+    households, (matrix, totals) = raked(synthetic_households())
+    in_target = np.diff(matrix.tocsr().indptr) > 0
+    matrix = matrix[in_target]
+    weights = households['household_weight'].values[in_target]
+    multipliers = replicate_multipliers(len(weights), 50, 0)
+
+    log_ratios = rake_replicates(matrix, totals, weights, multipliers, block_rows=32)
+
+    replicate_weights = weights[:, None] * multipliers * np.exp(matrix @ log_ratios)
+    np.testing.assert_allclose(matrix.T @ replicate_weights, np.repeat(totals[:, None], 50, axis=1),
+                               rtol=1e-8)
+
+
+def test_raked_replicates_carry_calibration():
+    households, calibration = raked(synthetic_households())
+
+    uncalibrated = district_standard_errors(households, counts_of(households), 100)
+    calibrated = district_standard_errors(households, counts_of(households), 100, calibration=calibration)
+
+    # Each state is one district, so its recipient total is fixed by its
+    # target in every raked replicate
+    population = (households['household_weight'] * households['n_snap_recipients']).sum()
+    assert (uncalibrated['snap_population_se'] > 1e-3 * population).all()
+    assert (calibrated['snap_population_se'] < 1e-6 * population).all()
+    assert (calibrated['total_weighted_snap_se'] > 0).all()
+
+
+def test_district_missing_from_a_replicate_has_no_standard_error():
+    households = synthetic_households(n_households=40).iloc[:20].copy()
+    households['congressional_district_geoid'] = np.repeat([601, 602], 10)
+    households['snap'] = 0.0
+    households.loc[households.index[[0, 1, 10, 11, 12]], 'snap'] = 1000.0
+    households['n_snap_recipients'] = (households['snap'] > 0) * 2
+    households['n_snap_under_18'] = households['n_snap_recipients'] // 2
+    households['n_snap_over_65'] = 0
+    households['n_snap_employed'] = households['n_snap_recipients'] // 2
+    multipliers = np.ones((20, 3), dtype=np.uint8)
+    # Replicate 0 drops both of district 601's SNAP households
+    multipliers[[0, 1], 0] = 0
+
+    standard_errors = state_standard_errors(households, counts_of(households), multipliers)
+
+    first, second = standard_errors.set_index('congressional_district_geoid').loc[[601, 602]].to_dict('records')
+    assert np.isnan(first['median_household_income_se']) and np.isnan(first['pct_under_18_se'])
+    assert first['snap_population_se'] > 0
+    assert not np.isnan(second['median_household_income_se'])
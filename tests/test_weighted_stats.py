@@ -0,0 +1,47 @@
+import warnings
+
+import numpy as np
+import pytest
+from microdf import MicroDataFrame
+
+from snap_districts import grouped_weighted_stats
+
+
+def tie_heavy_rows(seed, weight_unit=1.0, n_rows=300, n_groups=12):
+    """Small integer values and integer multiples of weight_unit as weights,
+    so shares often land exactly on 0.5."""
+    rng = np.random.default_rng(seed)
+    groups = rng.integers(0, n_groups, n_rows)
+    values = rng.integers(0, 6, n_rows).astype(float)
+    weights = rng.integers(0, 4, n_rows) * weight_unit
+    values[rng.random(n_rows) < 0.05] = np.nan
+    return groups, values, weights
+
+
+# With fractional units the running sums round, so ties at 0.5 only match
+# if the sums are taken in MicroSeries' order
+@pytest.mark.parametrize('weight_unit', [1.0, 0.1])
+@pytest.mark.parametrize('seed', range(20))
+def test_medians_match_microdf_groupby(seed, weight_unit):
+    groups, values, weights = tie_heavy_rows(seed, weight_unit)
+    expected = MicroDataFrame({'group': groups, 'value': values}, weights=weights).groupby('group')['value'].median()
+
+    keys, medians, _, _ = grouped_weighted_stats(groups, values, weights, {})
+
+    np.testing.assert_array_equal(keys, expected.index.values)
+    np.testing.assert_array_equal(medians, np.asarray(expected, dtype=float))
+
+
+def test_zero_weight_group_is_nan_without_warning():
+    groups = np.array([1, 1, 2, 2])
+    values = np.array([10.0, 20.0, 30.0, 40.0])
+    weights = np.array([0.0, 0.0, 1.0, 1.0])
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        keys, medians, sums, counts = grouped_weighted_stats(groups, values, weights, {'value': values})
+
+    np.testing.assert_array_equal(keys, [1, 2])
+    assert np.isnan(medians[0]) and medians[1] == 30.0
+    np.testing.assert_array_equal(sums['value'], [0.0, 70.0])
+    np.testing.assert_array_equal(counts, [0.0, 2.0])
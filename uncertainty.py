@@ -0,0 +1,168 @@
+"""Bootstrap standard errors for the district table, computed in batch.
+
+Each household's weight is multiplied by R independent Poisson(1) draws
+(the Poisson bootstrap), giving one households x R replicate weight
+matrix. With households sorted by district, every weighted sum for every
+replicate is one dense matrix product per district, and weighted medians
+for all replicates come from one sort per district, so R replicates cost
+one pass over a households x R matrix rather than R reruns. That pass is
+still R times the data the point estimates touch: with R=200, a synthetic
+1M-person, 52-district state takes about 1.1 s against 0.05 s for its
+district totals and medians.
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from calibration import rake_replicates
+from weighted_stats import grouped_weighted_medians
+
+
+# Poisson(1) counts looked up from uniform 16-bit draws: entry i is the
+# count whose CDF interval contains i / 2**16. Drawing uint16 and indexing
+# is several times faster than sampling Poisson variates directly.
+_POISSON_PMF = np.exp(-1) / np.cumprod(np.r_[1, np.arange(1, 16)])
+POISSON_TABLE = np.searchsorted(np.round(np.cumsum(_POISSON_PMF) * 2**16), np.arange(2**16),
+                                side='right').astype(np.uint8)
+
+
+def replicate_multipliers(n_households, n_replicates, seed):
+    """Poisson(1) bootstrap multipliers for each household and replicate.
+
+    Args:
+        n_households: Number of households
+        n_replicates: Number of replicates R
+        seed: Seed or seed sequence for the draws
+
+    Returns:
+        households x R uint8 array of counts
+    """
+    bit_generator = np.random.default_rng(seed).bit_generator
+    # Each raw 64-bit output split into four 16-bit draws
+    n_raw = -(-n_households * n_replicates // 4)
+    draws = bit_generator.random_raw(n_raw).view(np.uint16)[:n_households * n_replicates]
+    return POISSON_TABLE[draws].reshape(n_households, n_replicates)
+
+
+def district_standard_errors(household_df, counts, n_replicates, seed=0, calibration=None):
+    """Bootstrap standard errors of every district column.
+
+    The uint8 counts for every state are drawn up front, one byte per
+    household and replicate, so that with calibration the replicates can
+    be raked to national targets before any state is aggregated. States
+    are then aggregated one at a time, so the floating-point replicate
+    weights are a few of the biggest state's households x R at most;
+    calibration.rake_replicates works in blocks of households to stay
+    within that as well.
+
+    A replicate in which a district has no SNAP household with positive
+    weight has no median income or percentages for it; those columns'
+    standard errors are NaN for the district rather than taken over the
+    remaining replicates, which would understate them.
+
+    Args:
+        household_df: Household-level extract (one or more states)
+        counts: Per-household counts from roll_up_persons
+        n_replicates: Number of bootstrap replicates R
+        seed: Base seed; each state's FIPS code is mixed in so states draw
+            independent replicates that don't depend on which states run
+        calibration: Optional (matrix, totals) from
+            calibration.target_matrix for household_df's rows, whose
+            household_weight has been raked to them; each replicate is then
+            raked to the same totals, so the standard errors include the
+            calibration's effect
+
+    Returns:
+        DataFrame keyed by congressional_district_geoid and state_fips with
+        one <column>_se column per district column
+    """
+    state_fips = household_df['state_fips'].values
+    geoid = household_df['congressional_district_geoid'].values
+    states, multipliers = [], []
+    for fips in np.unique(state_fips):
+        rows = np.flatnonzero(state_fips == fips)
+        # Households sorted by district so each district is a contiguous
+        # block of the replicate matrix
+        states.append(rows[np.argsort(geoid[rows], kind='stable')])
+        multipliers.append(replicate_multipliers(len(rows), n_replicates, [seed, int(fips)]))
+
+    if calibration is not None:
+        matrix, totals = calibration
+        matrix = sp.csr_matrix(matrix)
+        # Only households that appear in some target are reweighted
+        in_target = np.diff(matrix.indptr) > 0
+        raked = [in_target[rows] for rows in states]
+        raked_rows = np.concatenate([rows[in_state] for rows, in_state in zip(states, raked)])
+        log_ratios = rake_replicates(
+            matrix[raked_rows], totals, household_df['household_weight'].values[raked_rows],
+            np.concatenate([draws[in_state] for draws, in_state in zip(multipliers, raked)]))
+
+    results = []
+    for rows, state_multipliers in zip(states, multipliers):
+        if calibration is not None:
+            state_multipliers = state_multipliers * np.exp(matrix[rows] @ log_ratios)
+        results.append(state_standard_errors(
+            household_df.iloc[rows], {name: np.asarray(values)[rows] for name, values in counts.items()},
+            state_multipliers))
+    return pd.concat(results, ignore_index=True)
+
+
+def state_standard_errors(household_df, counts, multipliers):
+    """Bootstrap standard errors of every district column for one state.
+
+    Args:
+        household_df: Household-level extract for a single state, sorted by
+            congressional district
+        counts: Per-household counts from roll_up_persons
+        multipliers: households x R replicate weights as multiples of
+            household_weight, e.g. from replicate_multipliers
+
+    Returns:
+        DataFrame with one row per district, as district_standard_errors
+    """
+    geoid = household_df['congressional_district_geoid'].values
+    keys, starts = np.unique(geoid, return_index=True)
+    ends = np.append(starts[1:], len(geoid))
+    weight = household_df['household_weight'].values.astype(float)
+    snap = household_df['snap'].values.astype(float)
+    is_snap = snap > 0
+    n_replicates = multipliers.shape[1]
+
+    # One (households x columns)' @ (households x R) product per district
+    # gives every weighted sum for every replicate; uint8 counts are
+    # widened one district block at a time
+    sum_values = {
+        'snap_population': counts['n_snap_recipients'],
+        'snap_under_18': counts['n_snap_under_18'],
+        'snap_over_65': counts['n_snap_over_65'],
+        'snap_employed': counts['n_snap_employed'],
+        'household_weight': np.ones(len(geoid)),
+        'total_weighted_snap': household_df['snap'].values,
+        'one_sum_test': household_df['snap'].values > 0,
+    }
+    weighted = np.column_stack([np.asarray(values, dtype=float) for values in sum_values.values()])
+    weighted *= weight[:, None]
+    sums = np.stack([weighted[start:end].T @ multipliers[start:end] for start, end in zip(starts, ends)])
+    replicates = {name: sums[:, k] for k, name in enumerate(sum_values)}
+
+    median_keys, medians = grouped_weighted_medians(
+        geoid[is_snap], household_df['household_market_income'].values[is_snap],
+        multipliers[is_snap] * weight[is_snap, None])
+    replicates['median_household_income'] = np.full((len(keys), n_replicates), np.nan)
+    replicates['median_household_income'][np.searchsorted(keys, median_keys)] = medians
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        population = replicates['snap_population']
+        replicates['pct_under_18'] = replicates['snap_under_18'] / population * 100
+        replicates['pct_over_65'] = replicates['snap_over_65'] / population * 100
+        replicates['employment_rate'] = replicates['snap_employed'] / population * 100
+
+    standard_errors = pd.DataFrame({
+        'congressional_district_geoid': keys,
+        'state_fips': household_df['state_fips'].values[starts],
+    })
+    for name, values in replicates.items():
+        # NaN wherever any replicate lacks the statistic
+        standard_errors[f'{name}_se'] = np.std(values, axis=1, ddof=1)
+    return standard_errors
@@ -0,0 +1,61 @@
+"""Grouped weighted medians with MicroSeries.median's arithmetic.
+
+MicroSeries.median drops rows with zero weight or a missing value, sorts
+the rest by value with np.argsort, and takes the smallest value whose
+running weight sum divided by its last element reaches 0.5. Exact ties at
+0.5 are common, so the share has to come from the same float64 operations
+in the same order: a cumulative sum over every group with the preceding
+groups' total subtracted, or one taken in a different order of tied
+values, rounds differently and can move the median by a row.
+"""
+
+import numpy as np
+
+
+def grouped_weighted_medians(groups, values, weights):
+    """Weighted median of each group, for one or many weight columns.
+
+    Each group's rows are taken in their original order, reduced to those
+    MicroSeries.median keeps, sorted with np.argsort and cumulated on their
+    own, so with one weight column the result is identical to
+    MicroDataFrame.groupby(...).median(). With a weight matrix the rows are
+    sorted once per group for all columns, and a row is kept while any
+    column gives it positive weight.
+
+    Args:
+        groups: Integer group key per row
+        values: Values to take the median of
+        weights: Row weights, either one per row or a rows x R matrix (e.g.
+            bootstrap replicate weights)
+
+    Returns:
+        Tuple of (unique group keys, medians: one per group, or groups x R),
+        NaN where a group has no positive weight on a non-missing value
+    """
+    groups = np.asarray(groups)
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    positive = weights > 0
+    kept = ~np.isnan(values) & (positive if weights.ndim == 1 else positive.any(axis=1))
+    # Negative weights count as zero, which adds exactly nothing to a sum
+    weights = np.where(positive, weights, 0.0)
+
+    # Stable, so each group's rows stay in their original order
+    by_group = np.argsort(groups, kind='stable')
+    keys, starts = np.unique(groups[by_group], return_index=True)
+    ends = np.append(starts[1:], len(groups))
+
+    medians = np.full((len(keys),) + weights.shape[1:], np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for group, (start, end) in enumerate(zip(starts, ends)):
+            rows = by_group[start:end]
+            rows = rows[kept[rows]]
+            if len(rows) == 0:
+                continue
+            rows = rows[np.argsort(values[rows])]
+            cumulative = np.cumsum(weights[rows], axis=0)
+            # All-zero columns give 0 / 0 = NaN, which never reaches 0.5
+            reached = cumulative / cumulative[-1] >= 0.5
+            first = np.argmax(reached, axis=0)
+            medians[group] = np.where(reached.any(axis=0), values[rows][first], np.nan)
+    return keys, medians